@@ -1,11 +1,17 @@
 import re
+import argparse
 import requests
 from datetime import datetime
 import textwrap
 from typing import Dict, Any
+from st_ndjson import NdjsonWriter
 
 ALERTS_URL = "https://s3.amazonaws.com/st-service-alerts-prod/alerts_pb.json"
 
+parser = argparse.ArgumentParser(description="Sound Transit service alerts")
+parser.add_argument('-j', '--json', action='store_true', help='Headless mode: print one JSON object per alert')
+parser.add_argument('--url', type=str, default=ALERTS_URL, help='Alerts feed to read (default: Sound Transit)')
+
 def _color(text: str, code: str) -> str:
     return f"\033[{code}m{text}\033[0m"
 
@@ -101,25 +107,33 @@ def summarize_alert(entity: Dict[str, Any]) -> str:
         out_lines.append(f"{wrapped_desc}")
     return "\n".join(out_lines)
 
-def fetch_and_print(url: str = ALERTS_URL):
+def alert_record(entity: Dict[str, Any]) -> Dict[str, Any]:
+    # plain fields for headless mode, no formatting applied
+    alert = entity.get("alert", {})
+    active = alert.get("active_period", [])
+    return {
+        "id": entity.get("id", ""),
+        "effect": alert.get("effect", "UNKNOWN"),
+        "severity": alert.get("severity_level", "UNKNOWN"),
+        "header": _safe_translation(alert, "header_text"),
+        "description": _safe_translation(alert, "description_text"),
+        "start": active[0].get("start") if active else None,
+        "end": active[0].get("end") if active else None,
+        "informed_entities": alert.get("informed_entity", []),
+    }
+
+def fetch_alerts(url: str = ALERTS_URL):
+    """Return (entities sorted most recent first, error message or None)."""
     try:
         resp = requests.get(url, timeout=10)
     except Exception as e:
-        print(_color("Network error fetching alerts:", "1;31"), str(e))
-        return
+        return [], f"Network error fetching alerts: {e}"
     if resp.status_code != 200:
-        print(_color("Failed to fetch alerts:", "1;31"), resp.status_code)
-        return
+        return [], f"Failed to fetch alerts: {resp.status_code}"
     try:
         data = resp.json()
     except Exception as e:
-        print(_color("Failed to parse JSON:", "1;31"), str(e))
-        return
-
-    entities = data.get("entity", [])
-    if not entities:
-        print(_color("No alerts found.", "1;33"))
-        return
+        return [], f"Failed to parse JSON: {e}"
 
     # sort alerts by active start time descending (most recent first)
     def _start_of(e):
@@ -128,9 +142,33 @@ def fetch_and_print(url: str = ALERTS_URL):
             return ap[0].get("start", 0) if ap else 0
         except Exception:
             return 0
-    for ent in sorted(entities, key=_start_of, reverse=True):
+    return sorted(data.get("entity", []), key=_start_of, reverse=True), None
+
+def fetch_and_print(url: str = ALERTS_URL):
+    entities, error = fetch_alerts(url)
+    if error:
+        label, _, detail = error.partition(": ")
+        print(_color(label + ":", "1;31"), detail)
+        return
+    if not entities:
+        print(_color("No alerts found.", "1;33"))
+        return
+    for ent in entities:
         print(summarize_alert(ent))
         print("-" * 80)
 
+def fetch_and_emit(url: str = ALERTS_URL, output=None):
+    output = output or NdjsonWriter()
+    entities, error = fetch_alerts(url)
+    if error:
+        output.error(error)
+    for ent in entities:
+        output.add("alert", **alert_record(ent))
+    output.flush()
+
 if __name__ == "__main__":
-    fetch_and_print()
\ No newline at end of file
+    args = parser.parse_args()
+    if args.json:
+        fetch_and_emit(args.url)
+    else:
+        fetch_and_print(args.url)
\ No newline at end of file
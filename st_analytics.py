@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+
+import os
+import csv
+import argparse
+import datetime
+import time
+from typing import Dict
+
+import numpy as np
+
+from st_link import ARCHIVE_FIELDS, line_stations
+
+STRING_FIELDS = ("line", "trip_id", "vehicle_id")
+
+parser = argparse.ArgumentParser(description="Delay and travel-time report over an st_link.py poll archive")
+parser.add_argument('archive', type=str, help='CSV archive written by st_link.py --archive')
+parser.add_argument('-o', '--out', type=str, default='.', help='Directory for the report files (default: .)')
+parser.add_argument('-d', '--date', type=str, default=None, help='Only report this service date (YYYY-MM-DD)')
+parser.add_argument('--early', type=float, default=60, help='Seconds early still counted as on time (default: 60)')
+parser.add_argument('--late', type=float, default=300, help='Seconds late still counted as on time (default: 300)')
+parser.add_argument('--max-gap', type=float, default=120, help='Ignore stop changes across update gaps longer than this (default: 120)')
+
+def _to_float(column: np.ndarray) -> np.ndarray:
+    # -1 for empty or unreadable fields
+    try:
+        return np.where(column == "", "-1", column).astype(np.float64)
+    except ValueError:
+        out = np.full(len(column), -1.0)
+        for i, v in enumerate(column):
+            try:
+                out[i] = float(v)
+            except ValueError:
+                pass
+        return out
+
+def _read_csv(path: str) -> Dict[str, np.ndarray]:
+    with open(path, newline="") as f:
+        header = next(csv.reader(f))
+    numeric = [name for name in ARCHIVE_FIELDS if name not in STRING_FIELDS]
+    numeric_cols = [header.index(name) for name in numeric]
+    string_cols = [header.index(name) for name in STRING_FIELDS]
+    try:
+        # numpy's C parser, one pass for the numbers and one for the strings
+        values = np.loadtxt(path, delimiter=",", skiprows=1, ndmin=2, dtype=np.float64, usecols=numeric_cols)
+        strings = np.loadtxt(path, delimiter=",", skiprows=1, ndmin=2, dtype=str, usecols=string_cols)
+    except ValueError:
+        # an empty or broken field somewhere: the slower parser, in one pass so a row with
+        # the wrong number of fields is skipped from every column alike
+        table = np.genfromtxt(path, delimiter=",", skip_header=1, dtype=str, invalid_raise=False, ndmin=2)
+        values = np.column_stack([_to_float(table[:, c]) for c in numeric_cols])
+        strings = table[:, string_cols]
+    cols = {name: values[:, i] for i, name in enumerate(numeric)}
+    for i, name in enumerate(STRING_FIELDS):
+        # integer codes plus a code -> string lookup
+        names, codes = np.unique(strings[:, i], return_inverse=True)
+        cols[name] = codes.astype(np.int32)
+        cols[name + "_names"] = names
+    return cols
+
+def load_archive(path: str) -> Dict[str, np.ndarray]:
+    """Load the poll archive as columns, caching the parsed arrays next to it."""
+    cache = path + ".npz"
+    if os.path.exists(cache) and os.path.getmtime(cache) >= os.path.getmtime(path):
+        with np.load(cache) as npz:
+            return {name: npz[name] for name in npz.files}
+    cols = _read_csv(path)
+    np.savez(cache, **cols)
+    return cols
+
+def _epoch_day(date_str: str) -> int:
+    return datetime.date.fromisoformat(date_str).toordinal() - datetime.date(1970, 1, 1).toordinal()
+
+def _group_order_stats(groups: np.ndarray, values: np.ndarray, counts: np.ndarray):
+    # median and 90th percentile of values per group, without a Python loop over groups
+    order = np.lexsort((values, groups))
+    ordered = values[order]
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    median = ordered[starts + (counts - 1) // 2]
+    p90 = ordered[starts + ((counts - 1) * 0.9).astype(np.int64)]
+    return median, p90
+
+def analyze(cols: Dict[str, np.ndarray], date=None, early=60.0, late=300.0, max_gap=120.0):
+    poll_time = cols["poll_time"]
+    if not len(poll_time):
+        raise ValueError("archive is empty")
+    # service days in local time, as riders see them; the offset is looked up once per
+    # hour so archives spanning a DST change are bucketed correctly on both sides
+    hours, hour_index = np.unique((poll_time // 3600).astype(np.int64), return_inverse=True)
+    hour_offset = np.array([time.localtime(int(h) * 3600).tm_gmtoff for h in hours], dtype=np.int64)
+    day = ((poll_time + hour_offset[hour_index]) // 86400).astype(np.int64)
+
+    keep = poll_time > 0  # rows the parser had to fill in
+    if date is not None:
+        keep &= day == _epoch_day(date)
+    line = cols["line"][keep]
+    trip = cols["trip_id"][keep]
+    vehicle = cols["vehicle_id"][keep]
+    next_stop = cols["next_stop_index"][keep].astype(np.int64)
+    deviation = cols["schedule_deviation"][keep]
+    # when the vehicle reported, not when it was polled; a stale vehicle repeats its
+    # last report under new poll times
+    update_time = cols["last_update_time"][keep]
+    update_time = np.where(update_time > 0, update_time, poll_time[keep])
+    day = day[keep]
+    if not len(update_time):
+        raise ValueError(f"no polls on {date}")
+
+    # a run is one trip id on one service day, rows ordered by time
+    order = np.lexsort((update_time, day, trip))
+    line, trip, vehicle, next_stop = line[order], trip[order], vehicle[order], next_stop[order]
+    deviation, update_time, day = deviation[order], update_time[order], day[order]
+    # drop repeated reports
+    fresh = np.ones(len(trip), dtype=bool)
+    fresh[1:] = (trip[1:] != trip[:-1]) | (day[1:] != day[:-1]) | (update_time[1:] != update_time[:-1])
+    line, trip, vehicle, next_stop = line[fresh], trip[fresh], vehicle[fresh], next_stop[fresh]
+    deviation, update_time, day = deviation[fresh], update_time[fresh], day[fresh]
+    run_start = np.ones(len(trip), dtype=bool)
+    run_start[1:] = (trip[1:] != trip[:-1]) | (day[1:] != day[:-1])
+    run = np.cumsum(run_start) - 1
+
+    # a station is passed when the next stop of a run changes between two reports
+    passed = ((run[1:] == run[:-1]) & (next_stop[1:] != next_stop[:-1]) & (next_stop[:-1] >= 0)
+              & (update_time[1:] - update_time[:-1] <= max_gap))
+    ev_station = next_stop[:-1][passed]
+    ev_time = ((update_time[:-1] + update_time[1:]) / 2)[passed]
+    ev_deviation = deviation[:-1][passed]
+    ev_run = run[1:][passed]
+    ev_line = line[1:][passed]
+    ev_day = day[1:][passed]
+
+    # segment travel times between consecutive stations
+    consecutive = (ev_run[1:] == ev_run[:-1]) & (np.abs(ev_station[1:] - ev_station[:-1]) == 1)
+    seg_from = ev_station[:-1][consecutive]
+    seg_to = ev_station[1:][consecutive]
+    seg_line = ev_line[1:][consecutive]
+    seg_time = (ev_time[1:] - ev_time[:-1])[consecutive]
+    n_stations = max(len(stations) for stations in line_stations.values())
+    seg_key = (seg_line.astype(np.int64) * n_stations + seg_from) * n_stations + seg_to
+    keys, seg_group, seg_count = np.unique(seg_key, return_inverse=True, return_counts=True)
+    seg_mean = np.bincount(seg_group, seg_time) / seg_count if len(keys) else np.empty(0)
+    seg_median, seg_p90 = (_group_order_stats(seg_group, seg_time, seg_count)
+                           if len(keys) else (np.empty(0), np.empty(0)))
+
+    # schedule deviation per run; runs are contiguous after the sort
+    starts = np.flatnonzero(run_start)
+    ends = np.concatenate((starts[1:], [len(run)]))
+    run_count = ends - starts
+    trip_mean = np.add.reduceat(deviation, starts) / run_count
+    trip_max = np.maximum.reduceat(deviation, starts)
+
+    # on-time share of station passages per (day, line)
+    on_time = (ev_deviation >= -early) & (ev_deviation <= late)
+    n_lines = len(cols["line_names"])
+    ot_key = ev_day * n_lines + ev_line
+    ot_keys, ot_group, ot_count = np.unique(ot_key, return_inverse=True, return_counts=True)
+    ot_pct = 100 * np.bincount(ot_group, on_time) / ot_count if len(ot_keys) else np.empty(0)
+
+    return {
+        "segment_line": (keys // (n_stations * n_stations)).astype(np.int32),
+        "segment_from": (keys // n_stations) % n_stations,
+        "segment_to": keys % n_stations,
+        "segment_count": seg_count,
+        "segment_mean": seg_mean,
+        "segment_median": seg_median,
+        "segment_p90": seg_p90,
+        "trip_id": trip[starts],
+        "trip_day": day[starts],
+        "trip_line": line[starts],
+        "trip_vehicle": vehicle[ends - 1],
+        "trip_polls": run_count,
+        "trip_mean_deviation": trip_mean,
+        "trip_max_deviation": trip_max,
+        "trip_final_deviation": deviation[ends - 1],
+        "ontime_day": ot_keys // n_lines,
+        "ontime_line": (ot_keys % n_lines).astype(np.int32),
+        "ontime_passages": ot_count,
+        "ontime_pct": ot_pct,
+        "line_names": cols["line_names"],
+        "trip_id_names": cols["trip_id_names"],
+        "vehicle_id_names": cols["vehicle_id_names"],
+    }
+
+def _day_str(day) -> str:
+    return (datetime.date(1970, 1, 1) + datetime.timedelta(days=int(day))).isoformat()
+
+def write_report(report, out_dir: str) -> None:
+    os.makedirs(out_dir, exist_ok=True)
+    np.savez_compressed(os.path.join(out_dir, "report.npz"), **report)
+    lines = report["line_names"]
+    trips = report["trip_id_names"]
+    vehicles = report["vehicle_id_names"]
+
+    with open(os.path.join(out_dir, "segments.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["line", "from", "to", "count", "mean_s", "median_s", "p90_s"])
+        for ln, a, b, n, mean, median, p90 in zip(
+                report["segment_line"], report["segment_from"], report["segment_to"], report["segment_count"],
+                report["segment_mean"], report["segment_median"], report["segment_p90"]):
+            names = list(line_stations[lines[ln]])
+            writer.writerow([lines[ln], names[a], names[b], n, round(mean, 1), round(median, 1), round(p90, 1)])
+
+    with open(os.path.join(out_dir, "trips.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["date", "line", "trip_id", "vehicle_id", "polls",
+                         "mean_deviation_s", "max_deviation_s", "final_deviation_s"])
+        for d, ln, tr, v, n, mean, mx, final in zip(
+                report["trip_day"], report["trip_line"], report["trip_id"], report["trip_vehicle"],
+                report["trip_polls"], report["trip_mean_deviation"], report["trip_max_deviation"],
+                report["trip_final_deviation"]):
+            writer.writerow([_day_str(d), lines[ln], trips[tr], vehicles[v], n, round(mean, 1), round(mx), round(final)])
+
+    with open(os.path.join(out_dir, "ontime.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["date", "line", "passages", "on_time_pct"])
+        for d, ln, n, pct in zip(report["ontime_day"], report["ontime_line"],
+                                 report["ontime_passages"], report["ontime_pct"]):
+            writer.writerow([_day_str(d), lines[ln], n, round(pct, 1)])
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    t0 = time.perf_counter()
+    cols = load_archive(args.archive)
+    report = analyze(cols, date=args.date, early=args.early, late=args.late, max_gap=args.max_gap)
+    write_report(report, args.out)
+    print(f"{len(cols['poll_time'])} rows, {len(report['trip_id'])} trips, "
+          f"{len(report['segment_count'])} segments in {time.perf_counter() - t0:.2f}s")
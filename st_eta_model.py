@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+from typing import Dict, List, Optional, Tuple
+
+ETA_MODEL_PATH = os.path.join(os.path.expanduser("~"), ".cache", "link-light-rail", "eta_model.json")
+ALPHA = 0.1          # EWMA weight of a new sample
+WARMUP = 5           # samples before outliers are clipped
+CLIP_DEVIATIONS = 4  # clip samples further than this many mean deviations from the mean
+SAVE_EVERY = 60      # seconds between writes to disk
+ALL_DAY = -1         # hour bucket that collects samples from every hour
+
+class RunningStat():
+    """EWMA mean and mean absolute deviation, O(1) per sample."""
+
+    __slots__ = ("mean", "dev", "n")
+
+    def __init__(self, mean: float = 0.0, dev: float = 0.0, n: int = 0) -> None:
+        self.mean = mean
+        self.dev = dev
+        self.n = n
+
+    def add(self, x: float) -> None:
+        if self.n == 0:
+            self.mean = x
+            self.dev = 0.0
+        else:
+            if self.n >= WARMUP and self.dev > 0:
+                # a train held at a station should not drag the estimate for hours
+                bound = CLIP_DEVIATIONS * self.dev
+                x = min(max(x, self.mean - bound), self.mean + bound)
+            self.dev += ALPHA * (abs(x - self.mean) - self.dev)
+            self.mean += ALPHA * (x - self.mean)
+        self.n += 1
+
+class EtaModel():
+    """Learned stop-to-stop travel and dwell times per line, station pair and hour of day.
+
+    A travel sample is the time between a vehicle passing two consecutive
+    stops, so it includes the dwell at the second stop; the arrival at a stop
+    is therefore predicted as travel minus that stop's dwell.
+    """
+
+    def __init__(self, path: Optional[str] = ETA_MODEL_PATH) -> None:
+        self.path = path
+        self.travel: Dict[Tuple[str, int, int, int], RunningStat] = {}
+        self.dwell: Dict[Tuple[str, int, int], RunningStat] = {}
+        self._dirty = False
+        self._saved_at = time.time()
+        if path:
+            self.load()
+
+    @staticmethod
+    def _hour(t: float) -> int:
+        return time.localtime(t).tm_hour
+
+    def observe_travel(self, line: str, from_index: int, to_index: int, seconds: float, t: float) -> None:
+        if seconds <= 0:
+            return
+        for hour in (self._hour(t), ALL_DAY):
+            key = (line, from_index, to_index, hour)
+            stat = self.travel.get(key)
+            if stat is None:
+                stat = self.travel[key] = RunningStat()
+            stat.add(seconds)
+        self._dirty = True
+
+    def observe_dwell(self, line: str, stop_index: int, seconds: float, t: float) -> None:
+        if seconds <= 0:
+            return
+        for hour in (self._hour(t), ALL_DAY):
+            key = (line, stop_index, hour)
+            stat = self.dwell.get(key)
+            if stat is None:
+                stat = self.dwell[key] = RunningStat()
+            stat.add(seconds)
+        self._dirty = True
+
+    def travel_time(self, line: str, from_index: int, to_index: int, t: float) -> Optional[float]:
+        stat = (self.travel.get((line, from_index, to_index, self._hour(t)))
+                or self.travel.get((line, from_index, to_index, ALL_DAY)))
+        return stat.mean if stat else None
+
+    def dwell_time(self, line: str, stop_index: int, t: float) -> float:
+        stat = (self.dwell.get((line, stop_index, self._hour(t)))
+                or self.dwell.get((line, stop_index, ALL_DAY)))
+        return stat.mean if stat else 0.0
+
+    def arrival_after_passage(self, line: str, passed_index: int, passed_time: float,
+                              next_index: int) -> Optional[float]:
+        """Absolute arrival time at next_index for a vehicle that passed passed_index at passed_time."""
+        travel = self.travel_time(line, passed_index, next_index, passed_time)
+        if travel is None:
+            return None
+        return passed_time + max(travel - self.dwell_time(line, next_index, passed_time), 0.0)
+
+    def predict(self, line: str, stops: List[int], first_arrival: float) -> List[float]:
+        """Absolute arrival times at stops[1:], given the arrival time at stops[0].
+
+        Stops beyond the first one the model knows nothing about are left out.
+        """
+        out = []
+        arrival = first_arrival
+        for a, b in zip(stops, stops[1:]):
+            travel = self.travel_time(line, a, b, arrival)
+            if travel is None:
+                break
+            arrival += self.dwell_time(line, a, arrival) + max(travel - self.dwell_time(line, b, arrival), 0.0)
+            out.append(arrival)
+        return out
+
+    def load(self) -> None:
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return  # start from scratch
+        for line, a, b, hour, mean, dev, n in data.get("travel", []):
+            self.travel[(line, a, b, hour)] = RunningStat(mean, dev, n)
+        for line, stop, hour, mean, dev, n in data.get("dwell", []):
+            self.dwell[(line, stop, hour)] = RunningStat(mean, dev, n)
+
+    def save(self) -> None:
+        if not self.path or not self._dirty:
+            return
+        data = {
+            "travel": [[*key, round(s.mean, 2), round(s.dev, 2), s.n] for key, s in self.travel.items()],
+            "dwell": [[*key, round(s.mean, 2), round(s.dev, 2), s.n] for key, s in self.dwell.items()],
+        }
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+        self._dirty = False
+        self._saved_at = time.time()
+
+    def maybe_save(self, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        if self._dirty and now - self._saved_at >= SAVE_EVERY:
+            self.save()
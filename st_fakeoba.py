@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qs, urlsplit
+
+from st_link import agency_id, line_stations, line_to_route_id
+
+STATION_SPACING = 1000.0   # metres between simulated stations
+SEGMENT_TIME = 120         # seconds from one station to the next
+DEG_PER_STATION = 0.009    # roughly STATION_SPACING in latitude
+
+parser = argparse.ArgumentParser(description="Local OneBusAway stand-in with simulated vehicles")
+parser.add_argument('-p', '--port', type=int, default=8080, help='Port to listen on (default: 8080)')
+parser.add_argument('--routes', type=int, default=0, help='Synthetic routes to add to the three Link lines (default: 0)')
+parser.add_argument('--vehicles', type=int, default=8, help='Vehicles per route (default: 8)')
+parser.add_argument('--latency', type=float, default=0, help='Added response latency in ms (default: 0)')
+parser.add_argument('--jitter', type=float, default=0, help='Random extra latency up to this many ms (default: 0)')
+parser.add_argument('--error-rate', type=float, default=0, help='Share of requests answered with HTTP 500 (default: 0)')
+parser.add_argument('--stale-rate', type=float, default=0, help='Share of vehicles with an old lastUpdateTime (default: 0)')
+parser.add_argument('--stale-seconds', type=float, default=300, help='How old stale updates are (default: 300)')
+parser.add_argument('--padding', type=int, default=0, help='Extra bytes added to every payload (default: 0)')
+parser.add_argument('--alerts', type=int, default=5, help='Alerts in the alerts feed (default: 5)')
+
+def encode_polyline(coords) -> str:
+    """Google encoded polyline of (lat, lon) pairs; inverse of st_linref.decode_polyline."""
+    out = []
+    prev_lat = prev_lon = 0
+    for lat, lon in coords:
+        ilat, ilon = round(lat * 1e5), round(lon * 1e5)
+        for delta in (ilat - prev_lat, ilon - prev_lon):
+            v = ~(delta << 1) if delta < 0 else delta << 1
+            while v >= 0x20:
+                out.append(chr((0x20 | (v & 0x1f)) + 63))
+                v >>= 5
+            out.append(chr(v + 63))
+        prev_lat, prev_lon = ilat, ilon
+    return "".join(out)
+
+@dataclass
+class SimConfig():
+    routes: int = 0
+    vehicles: int = 8
+    latency: float = 0.0       # ms
+    jitter: float = 0.0        # ms
+    error_rate: float = 0.0
+    stale_rate: float = 0.0
+    stale_seconds: float = 300.0
+    padding: int = 0
+    alerts: int = 5
+
+class SimRoute():
+    def __init__(self, route_id: str, station_names: List[str], n_vehicles: int, lon: float) -> None:
+        self.route_id = route_id
+        self.station_names = station_names
+        self.n_vehicles = n_vehicles
+        self.stop_ids = [f"{route_id}_S{i}" for i in range(len(station_names))]
+        self.coords = [(47.2 + i * DEG_PER_STATION, lon) for i in range(len(station_names))]
+        self.trip_time = (len(station_names) - 1) * SEGMENT_TIME
+
+    def stops(self) -> List[Dict]:
+        return [{"id": stop_id, "name": name, "lat": lat, "lon": lon}
+                for stop_id, name, (lat, lon) in zip(self.stop_ids, self.station_names, self.coords)]
+
+    def stop_order(self, direction: str) -> List[int]:
+        # direction "1" runs towards the highest station index, like st_link.directions
+        n = len(self.station_names)
+        return list(range(n)) if direction == "1" else list(range(n - 1, -1, -1))
+
+    def stop_times(self, direction: str, start: float, scale: int = 1) -> List[Dict]:
+        """Stop times of a trip leaving its first station at start, in seconds times scale."""
+        return [{
+            "stopId": self.stop_ids[i],
+            "arrivalTime": int((start + j * SEGMENT_TIME) * scale),
+            "departureTime": int((start + j * SEGMENT_TIME) * scale),
+            "distanceAlongTrip": j * STATION_SPACING,
+        } for j, i in enumerate(self.stop_order(direction))]
+
+    def timetable(self, since: float, until: float) -> Dict[str, List[Dict]]:
+        """Trips per direction id overlapping [since, until], with the ids vehicle() gives them."""
+        cycle = 2 * self.trip_time
+        trips = {"0": [], "1": []}
+        for k in range(self.n_vehicles):
+            offset = k * cycle / self.n_vehicles
+            for run in range(int((since + offset) // cycle) - 1, int((until + offset) // cycle) + 1):
+                for direction, start in (("0", run * cycle - offset), ("1", run * cycle - offset + self.trip_time)):
+                    if start + self.trip_time >= since and start <= until:
+                        trip_id = f"{self.route_id}_{k}_{run}{direction}"
+                        stop_times = [dict(st, tripId=trip_id) for st in self.stop_times(direction, start, 1000)]
+                        trips[direction].append({"tripId": trip_id, "stopTimes": stop_times})
+        return trips
+
+    def vehicle(self, k: int, now: float, config: SimConfig, rng: random.Random) -> Dict:
+        """Trip details of vehicle k at time now; vehicles shuttle end to end at even spacing."""
+        cycle = 2 * self.trip_time
+        t = now + k * cycle / self.n_vehicles
+        run, phase = divmod(t, cycle)
+        direction = "0" if phase < self.trip_time else "1"
+        elapsed = phase % self.trip_time
+        n = len(self.station_names)
+        order = self.stop_order(direction)
+        progress = elapsed / SEGMENT_TIME
+        nxt = min(int(progress) + 1, n - 1)
+        trip_id = f"{self.route_id}_{k}_{int(run)}{direction}"
+        service_date = (int(now) // 86400) * 86400
+        start = now - elapsed - service_date
+        updated = now - (config.stale_seconds if rng.random() < config.stale_rate else rng.uniform(0, 10))
+        status = {
+            "activeTripId": trip_id,
+            "vehicleId": f"{self.route_id}_V{k}",
+            "serviceDate": service_date * 1000,
+            "nextStop": self.stop_ids[order[nxt]],
+            "nextStopTimeOffset": round((nxt - progress) * SEGMENT_TIME),
+            "lastUpdateTime": int(updated * 1000),
+            "distanceAlongTrip": progress * STATION_SPACING,
+            "scheduledDistanceAlongTrip": progress * STATION_SPACING,
+            "totalDistanceAlongTrip": (n - 1) * STATION_SPACING,
+            "scheduleDeviation": (k * 37) % 240 - 60,
+        }
+        schedule = {"stopTimes": self.stop_times(direction, start)}
+        trip = {"id": trip_id, "routeId": self.route_id, "directionId": direction}
+        return {"tripId": trip_id, "serviceDate": service_date * 1000, "status": status,
+                "schedule": schedule, "trip": trip}
+
+class Simulation():
+    def __init__(self, config: SimConfig, seed: int = 0) -> None:
+        self.config = config
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.routes: Dict[str, SimRoute] = {}
+        for i, (line, route_id) in enumerate(line_to_route_id.items()):
+            names = sorted(line_stations[line], key=line_stations[line].get)
+            self.routes[route_id] = SimRoute(route_id, names, config.vehicles, -122.3 - i * 0.05)
+        for k in range(config.routes):
+            route_id = f"{agency_id}_SIM{k}"
+            names = [f"Sim {k} Stop {i}" for i in range(10 + k % 20)]
+            self.routes[route_id] = SimRoute(route_id, names, config.vehicles, -121.0 - k * 0.05)
+
+    def _random(self) -> float:
+        with self.lock:
+            return self.rng.random()
+
+    def _envelope(self, data: Dict) -> Dict:
+        if self.config.padding:
+            data.setdefault("references", {})["padding"] = "x" * self.config.padding
+        return {"code": 200, "currentTime": int(time.time() * 1000), "data": data}
+
+    def _vehicles(self, route: SimRoute, now: float):
+        with self.lock:
+            return [route.vehicle(k, now, self.config, self.rng) for k in range(route.n_vehicles)]
+
+    def trips_for_route(self, route_id: str, include_schedule: bool = False) -> Dict:
+        route = self.routes[route_id]
+        vehicles = self._vehicles(route, time.time())
+        # like OneBusAway, schedules only when asked for
+        keys = ("tripId", "serviceDate", "status") + (("schedule",) if include_schedule else ())
+        return self._envelope({
+            "list": [{key: v[key] for key in keys} for v in vehicles],
+            "references": {"stops": route.stops(), "trips": [v["trip"] for v in vehicles]},
+        })
+
+    def stops_for_route(self, route_id: str) -> Dict:
+        route = self.routes[route_id]
+        return self._envelope({
+            "entry": {
+                "routeId": route_id,
+                "stopIds": route.stop_ids,
+                "stopGroupings": [{"stopGroups": [{"id": "1", "stopIds": route.stop_ids},
+                                                  {"id": "0", "stopIds": route.stop_ids[::-1]}]}],
+                "polylines": [{"points": encode_polyline(route.coords)}],
+            },
+            "references": {"stops": route.stops()},
+        })
+
+    def schedule_for_route(self, route_id: str) -> Dict:
+        route = self.routes[route_id]
+        now = time.time()
+        service_date = (int(now) // 86400) * 86400
+        groupings = []
+        for direction, trips in route.timetable(now - 3600, now + 4 * 3600).items():
+            groupings.append({"directionId": direction, "stopIds": [route.stop_ids[i] for i in route.stop_order(direction)],
+                              "tripIds": [t["tripId"] for t in trips], "tripsWithStopTimes": trips})
+        return self._envelope({
+            "entry": {"routeId": route_id, "scheduleDate": service_date * 1000, "stopTripGroupings": groupings},
+            "references": {"stops": route.stops()},
+        })
+
+    def vehicles_for_agency(self) -> Dict:
+        now = time.time()
+        vehicles, trips = [], []
+        for route in self.routes.values():
+            for v in self._vehicles(route, now):
+                vehicles.append({"vehicleId": v["status"]["vehicleId"], "tripId": v["tripId"],
+                                 "lastUpdateTime": v["status"]["lastUpdateTime"], "tripStatus": v["status"]})
+                trips.append(v["trip"])
+        return self._envelope({"list": vehicles, "references": {"trips": trips, "stops": []}})
+
+    def alerts(self) -> Dict:
+        now = int(time.time())
+        entities = []
+        for i in range(self.config.alerts):
+            route_id = list(self.routes)[i % len(self.routes)]
+            entities.append({"id": f"sim-{i}", "alert": {
+                "effect": ("OTHER_EFFECT", "NO_SERVICE", "ACCESSIBILITY_ISSUE")[i % 3],
+                "severity_level": ("INFO", "WARNING", "SEVERE")[i % 3],
+                "header_text": {"translation": [{"text": f"Simulated alert {i}", "language": "en"}]},
+                "description_text": {"translation": [{"text": "Generated by st_fakeoba.py. " * 4, "language": "en"}]},
+                "active_period": [{"start": now - 3600 * i}],
+                "informed_entity": [{"agency_id": agency_id, "route_id": route_id}],
+            }})
+        feed = {"header": {"timestamp": now}, "entity": entities}
+        if self.config.padding:
+            feed["padding"] = "x" * self.config.padding
+        return feed
+
+WHERE_PATH = re.compile(r"^/api/where/([a-z-]+)/([^/]+)\.json$")
+
+class FakeObaHandler(BaseHTTPRequestHandler):
+    sim: Simulation = None  # set by make_server()
+
+    def do_GET(self):
+        config = self.sim.config
+        delay = config.latency + self.sim._random() * config.jitter
+        if delay:
+            time.sleep(delay / 1000)
+        if config.error_rate and self.sim._random() < config.error_rate:
+            return self._send(500, {"code": 500, "text": "simulated error"})
+
+        url = urlsplit(self.path)
+        path = url.path
+        try:
+            if path.endswith("alerts_pb.json"):
+                return self._send(200, self.sim.alerts())
+            m = WHERE_PATH.match(path)
+            if m:
+                method, arg = m.groups()
+                if method == "trips-for-route":
+                    return self._send(200, self.sim.trips_for_route(
+                        arg, parse_qs(url.query).get("includeSchedule") == ["true"]))
+                if method == "stops-for-route":
+                    return self._send(200, self.sim.stops_for_route(arg))
+                if method == "schedule-for-route":
+                    return self._send(200, self.sim.schedule_for_route(arg))
+                if method == "vehicles-for-agency":
+                    return self._send(200, self.sim.vehicles_for_agency())
+        except KeyError:
+            pass  # unknown route
+        self._send(404, {"code": 404, "text": "resource not found"})
+
+    def _send(self, code: int, body: Dict) -> None:
+        payload = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass  # keep soak output readable
+
+def make_server(config: SimConfig, port: int = 0, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Server bound to host:port (0 picks a free port); call serve_forever() to run it."""
+    handler = type("Handler", (FakeObaHandler,), {"sim": Simulation(config)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+def server_urls(server: ThreadingHTTPServer):
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}/api/where", f"http://{host}:{port}/alerts_pb.json"
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    config = SimConfig(routes=args.routes, vehicles=args.vehicles, latency=args.latency, jitter=args.jitter,
+                       error_rate=args.error_rate, stale_rate=args.stale_rate, stale_seconds=args.stale_seconds,
+                       padding=args.padding, alerts=args.alerts)
+    server = make_server(config, args.port)
+    api, alerts = server_urls(server)
+    print(f"API base: {api}")
+    print(f"Alerts:   {alerts}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
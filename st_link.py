@@ -1,18 +1,38 @@
 #!/usr/bin/env python3
 
+import os
 import sys
+import csv
 import argparse
 import requests
 import json
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import time
-from typing import List
+from typing import Dict, List, Optional
+from st_vehicle_state import VehicleStateStore
+from st_topology import TOPOLOGY_CACHE_DIR, load_topology
+from st_eta_model import EtaModel
+from st_map import LineMap
+from st_notify import SubscriptionEngine, load_watches, make_sink
+from st_ndjson import NdjsonWriter
+from st_linref import LineAxis
 
 api_key = "YOUR_API_KEY"
+api_base = "https://api.pugetsound.onebusaway.org/api/where"
+agency_id = "40"  # Sound Transit
 
 parser = argparse.ArgumentParser(description="Seattle Link Light Rail Train Tracker")
 parser.add_argument('-l', '--line', type=str, choices=['T', '1', '2'], default='1', help='Line to track (default: 1)')
-args = parser.parse_args()
+parser.add_argument('-i', '--interval', type=float, default=0, help='Poll every N seconds (default: 0, poll once)')
+parser.add_argument('-a', '--archive', type=str, default=None, help='Append trip statuses of every poll to this CSV file')
+parser.add_argument('-b', '--bulk', action='store_true', help='Fetch every agency vehicle in one call and show all lines')
+parser.add_argument('-m', '--map', action='store_true', help='Draw trains on a strip map of the line instead of a list')
+parser.add_argument('-w', '--watches', type=str, default=None, help='JSON-lines file of arrival watches to notify about')
+parser.add_argument('--notify', type=str, action='append', default=[],
+                    help='Where to deliver notifications: a file path, udp://host:port or unix:///path (repeatable)')
+parser.add_argument('-j', '--json', action='store_true', help='Headless mode: print one JSON object per train per poll')
+parser.add_argument('--api-base', type=str, default=None, help='OneBusAway API root to use instead of the Puget Sound server')
+parser.add_argument('-s', '--next-stops', type=int, default=3, help='Estimate arrivals for this many stops after the next one (default: 3)')
 
 line_to_route_id = {
     'T': '40_TLINE',
@@ -29,9 +49,110 @@ colors = {
     '1': '\033[1m\033[38;2;255;255;255m\033[48;2;40;129;63m',
     '2': '\033[1m\033[38;2;255;255;255m\033[48;2;0;124;173m'
 }
+# upstream predictions older than this are replaced by the learned ETA model
+STALE_AFTER = 90
+# metres per second between stations, when neither a schedule nor a learned time is known
+TYPICAL_SPEED = 12.0
+# seconds before a route whose stops-for-route request failed is tried again (bulk mode)
+TOPOLOGY_RETRY = 300
 
-route_id = line_to_route_id[args.line]
-url = f"https://api.pugetsound.onebusaway.org/api/where/trips-for-route/{route_id}.json?key={api_key}"
+# used for routes without their own entry above (buses in bulk mode)
+default_color = '\033[1m\033[38;2;255;255;255m\033[48;2;90;90;90m'
+
+line_stations = {
+    '1': {
+        "Federal Way Downtown": 0,
+        "Star Lake": 1,
+        "Kent Des Moines": 2,
+        "Angle Lake" : 3,
+        "SeaTac/Airport": 4,
+        "Tukwila Int'l Blvd": 5,
+        "Boeing Access Rd": 6,
+        "Rainier Beach": 7,
+        "Othello": 8,
+        "Graham St": 9,
+        "Columbia City": 10,
+        "Mount Baker": 11,
+        "Beacon Hill": 12,
+        "SODO": 13,
+        "Stadium": 14,
+        "Int'l Dist/Chinatown": 15,
+        "Pioneer Square": 16,
+        "Symphony": 17,
+        "Westlake": 18,
+        "Capitol Hill": 19,
+        "Univ of Washington": 20,
+        "U District": 21,
+        "Roosevelt": 22,
+        "Northgate": 23,
+        "Pinehurst": 24,
+        "Shoreline South/148th": 25,
+        "Shoreline North/185th": 26,
+        "Mountlake Terrace": 27,
+        "Lynnwood City Center": 28
+    },
+    '2': {
+        "Downtown Redmond": 0,
+        "Marymoor Village": 1,
+        "Redmond Technology": 2,
+        "Overlake Village": 3,
+        "BelRed": 4,
+        "Spring District": 5,
+        "Wilburton": 6,
+        "Bellevue Downtown": 7,
+        "East Main": 8,
+        "South Bellevue": 9,
+        "Mercer Island": 10,
+        "Judkins Park": 11,
+        "Int'l Dist/Chinatown": 12,
+        "Pioneer Square": 13,
+        "Symphony": 14,
+        "Westlake": 15,
+        "Capitol Hill": 16,
+        "Univ of Washington": 17,
+        "U District": 18,
+        "Roosevelt": 19,
+        "Northgate": 20,
+        "Pinehurst": 21,
+        "Shoreline South/148th": 22,
+        "Shoreline North/185th": 23,
+        "Mountlake Terrace": 24,
+        "Lynnwood City Center": 25
+    },
+    'T': {
+        "Tacoma Dome" : 0,
+        "S 25th": 1,
+        "Union Station": 2,
+        "Convention Center": 3,
+        "Theater District": 4,
+        "Old City Hall": 5,
+        "S 4th": 6,
+        "Stadium District": 7,
+        "Tacoma General": 8,
+        "6th Ave": 9,
+        "Hilltop District": 10,
+        "St Joseph": 11
+    }
+}
+
+# columns of the poll archive read by st_analytics.py
+ARCHIVE_FIELDS = [
+    "poll_time", "line", "trip_id", "vehicle_id", "direction_id", "next_stop_index",
+    "distance_along_trip", "total_distance", "schedule_deviation", "last_update_time"
+]
+
+def trips_for_route_url(route_id):
+    # schedules carry the stop distances the line axis projects trains with
+    return f"{api_base}/trips-for-route/{route_id}.json?key={api_key}&includeSchedule=true"
+
+def stops_for_route_url(route_id):
+    return f"{api_base}/stops-for-route/{route_id}.json?key={api_key}"
+
+def schedule_for_route_url(route_id, date):
+    return f"{api_base}/schedule-for-route/{route_id}.json?key={api_key}&date={date}"
+
+def vehicles_for_agency_url(agency_id):
+    return f"{api_base}/vehicles-for-agency/{agency_id}.json?key={api_key}"
 
 @dataclass
 class Train():
@@ -43,107 +164,68 @@ class Train():
     time_until: str
     leg_total: str
     pct_distance_along_trip: float
+    dwell_time: float = 0.0
+    line: str = '1'
+    # time_until comes from the learned model rather than the feed
+    estimated: bool = False
+    # (station, seconds) for the stops after the next one
+    next_etas: list = field(default_factory=list)
+    # metres from the first station along the line, -1 if unknown
+    axis_position: float = -1.0
+    # metres to the next train ahead in the same direction, -1 if none or not measured
+    gap_ahead: float = -1.0
 
     def __str__(self):
+        dwell = f" (stopped {round(self.dwell_time)}s)" if self.dwell_time else ""
+        approx = "~" if self.estimated else ""
+        then = "".join(f"\n  then {name} in ~{round(eta)}s" for name, eta in self.next_etas)
+        gap = f", {self.gap_ahead / 1000:.1f} km behind the next train" if self.gap_ahead >= 0 else ""
         return f"""
-{ colors[args.line] + self.direction + "\033[0m" } { "\033[1;44m" + self.vehicle_id + "\033[0m" }
-{ "\033[1;33m" + self.next_station + "\033[0m" } in {round(self.time_until)}s"""
+{ colors.get(self.line, default_color) + self.direction + "\033[0m" } { "\033[1;44m" + self.vehicle_id + "\033[0m" }
+{ "\033[1;33m" + self.next_station + "\033[0m" } in {approx}{round(self.time_until)}s{dwell}{gap}{then}"""
 
 class TrainGetter():
-    def __init__(self) -> None:
-        self.stop_id_to_name = {}
-        match args.line:
-            case '1':
-                self.name_to_index = {
-                    "Federal Way Downtown": 0,
-                    "Star Lake": 1,
-                    "Kent Des Moines": 2,
-                    "Angle Lake" : 3,
-                    "SeaTac/Airport": 4,
-                    "Tukwila Int'l Blvd": 5,
-                    "Boeing Access Rd": 6,
-                    "Rainier Beach": 7,
-                    "Othello": 8,
-                    "Graham St": 9,
-                    "Columbia City": 10,
-                    "Mount Baker": 11,
-                    "Beacon Hill": 12,
-                    "SODO": 13,
-                    "Stadium": 14,
-                    "Int'l Dist/Chinatown": 15,
-                    "Pioneer Square": 16,
-                    "Symphony": 17,
-                    "Westlake": 18,
-                    "Capitol Hill": 19,
-                    "Univ of Washington": 20,
-                    "U District": 21,
-                    "Roosevelt": 22,
-                    "Northgate": 23,
-                    "Pinehurst": 24,
-                    "Shoreline South/148th": 25,
-                    "Shoreline North/185th": 26,
-                    "Mountlake Terrace": 27,
-                    "Lynnwood City Center": 28
-                }
-            case '2':
-                self.name_to_index = {
-                    "Downtown Redmond": 0,
-                    "Marymoor Village": 1,
-                    "Redmond Technology": 2,
-                    "Overlake Village": 3,
-                    "BelRed": 4,
-                    "Spring District": 5,
-                    "Wilburton": 6,
-                    "Bellevue Downtown": 7,
-                    "East Main": 8,
-                    "South Bellevue": 9,
-                    "Mercer Island": 10,
-                    "Judkins Park": 11,
-                    "Int'l Dist/Chinatown": 12,
-                    "Pioneer Square": 13,
-                    "Symphony": 14,
-                    "Westlake": 15,
-                    "Capitol Hill": 16,
-                    "Univ of Washington": 17,
-                    "U District": 18,
-                    "Roosevelt": 19,
-                    "Northgate": 20,
-                    "Pinehurst": 21,
-                    "Shoreline South/148th": 22,
-                    "Shoreline North/185th": 23,
-                    "Mountlake Terrace": 24,
-                    "Lynnwood City Center": 25
-                }
-            case 'T':
-                self.name_to_index = {
-                    "Tacoma Dome" : 0,
-                    "S 25th": 1,
-                    "Union Station": 2,
-                    "Convention Center": 3,
-                    "Theater District": 4,
-                    "Old City Hall": 5,
-                    "S 4th": 6,
-                    "Stadium District": 7,
-                    "Tacoma General": 8,
-                    "6th Ave": 9,
-                    "Hilltop District": 10,
-                    "St Joseph": 11
-                }
+    def __init__(self, line='1', archive=None, topology=None, quiet=False, eta_model=None, next_stops=3,
+                 map_view=False, subscriptions=None, output=None) -> None:
+        self.line = line
+        # NdjsonWriter in headless mode; nothing is printed then
+        self.output = output
+        self.subscriptions = subscriptions
+        self.archive = archive
+        self.quiet = quiet
+        self.map_view = map_view
+        self.line_map = None  # built on first map frame
+        # learned travel/dwell times, shared between getters in bulk mode
+        self.eta_model = eta_model
+        self.next_stops = next_stops
+        # with a cached topology, stop names come from it instead of each response
+        self.topology = topology
+        self.stop_id_to_name = topology.stop_id_to_name if topology else {}
+        if line in line_stations:
+            self.name_to_index = line_stations[line]
+        else:
+            self.name_to_index = {name: i for i, name in enumerate(topology.station_names)}
 
         # precompute helpers used frequently to avoid repeated work
         self.station_names = list(self.name_to_index.keys())
-        self.line_directions = directions[args.line]
+        self.line_directions = directions.get(line, (0, -1))
         self.endpoint_name = (max(self.name_to_index, key=self.name_to_index.get)
                               if isinstance(self.line_directions[1], int)
                               else self.line_directions[1])
+        # shared distance axis used for ordering and the map
+        self.axis = LineAxis(self.station_names, topology)
         # trip-direction map is built once per API response in get_direction()
         self._trip_direction_map = None
+        # per-vehicle history kept across get_trains() calls
+        self.vehicle_state = VehicleStateStore()
+        self.events = []
 
     def station_id_to_name(self, id):
         return self.stop_id_to_name.get(id)
 
     def station_name_to_index(self, name):
-        return self.name_to_index[name]
+        # -1 for a stop off the station table, like get_next_station() for unknown ids
+        return self.name_to_index.get(name, -1)
 
     def get_direction(self, trip_id, api_dict):
         # Build a trip-id -> direction-name map once per response (cached)
@@ -175,34 +257,110 @@ class TrainGetter():
         return name, index
 
     def get_trains(self, json_str) -> List[Train]:
-        api_dict = json.loads(json_str)
-        # build stop id -> name mapping once per response
-        self.stop_id_to_name = {stop["id"]: stop["name"] for stop in api_dict["data"]["references"]["stops"]}
+        return self.get_trains_from_dict(json.loads(json_str))
+
+    def get_trains_from_dict(self, api_dict) -> List[Train]:
+        if not self.topology:
+            # build stop id -> name mapping once per response
+            self.stop_id_to_name = {stop["id"]: stop["name"] for stop in api_dict["data"]["references"]["stops"]}
         # clear per-response cache
         self._trip_direction_map = None
+        self.events = []
         out = []
         for trip in api_dict["data"]["list"]:
             # skip trips with no status
             if "status" not in trip:
-                print(f"Skipping trip without status (tripId={trip.get('tripId','?')})")
+                self.report_error(f"Skipping trip without status (tripId={trip.get('tripId','?')})", trip.get('tripId'))
                 continue
             try:
                 t = self.process_train(trip, api_dict)
                 out.append(t)
             except Exception as e:
-                print(f"Error processing trip {trip.get('tripId','?')}, skipping: {e}")
+                self.report_error(f"Error processing trip {trip.get('tripId','?')}, skipping: {e}", trip.get('tripId'))
                 continue
-        print(colors[args.line] + f"{args.line} Line" + "\033[0m")
+        self.axis.forget_trips({trip.get("tripId") for trip in api_dict["data"]["list"]})
+        self.set_spacing(out)
+        if self.output:
+            self.emit_trains(out)
+        elif not self.quiet:
+            self.print_trains(out)
+        if self.archive:
+            self.archive_trips(api_dict)
+        if self.eta_model:
+            self.eta_model.maybe_save()
+        if self.subscriptions:
+            self.subscriptions.evaluate(self.line, out)
+        return out
 
-        def northness(x: Train) -> float:
-            if x.next_station_index < 0:
-                return float("-inf")
-            return (x.next_station_index - 0.5) if (x.direction == self.endpoint_name) else (x.next_station_index + 0.5)
+    def report_error(self, message, trip_id=None):
+        if self.output:
+            self.output.error(message, line=self.line, route_id=line_to_route_id.get(self.line, self.line), trip_id=trip_id)
+        elif not self.quiet:
+            print(message)
 
-        for t_sorted in sorted(out, key=lambda x: (-northness(x), x.pct_distance_along_trip)):
+    def emit_trains(self, trains):
+        for t in trains:
+            self.output.add(
+                "train",
+                line=self.line,
+                trip_id=t.id,
+                vehicle_id=t.vehicle_id.strip() or None,
+                direction=t.direction.strip(),
+                next_stop=t.next_station,
+                next_stop_index=t.next_station_index,
+                eta=round(t.time_until, 1),
+                eta_estimated=t.estimated,
+                leg_total=t.leg_total,
+                pct_distance_along_trip=round(t.pct_distance_along_trip, 4),
+                dwell_time=round(t.dwell_time, 1),
+                next_etas=[{"stop": name, "eta": round(eta, 1)} for name, eta in t.next_etas],
+                axis_position=round(t.axis_position, 1),
+                gap_ahead=round(t.gap_ahead, 1)
+            )
+
+    def print_trains(self, trains):
+        if self.map_view:
+            if self.line_map is None:
+                self.line_map = LineMap(self.line, self.station_names, colors.get(self.line, default_color), self.endpoint_name,
+                                        axis=self.axis)
+            print(self.line_map.render(trains))
+            return
+        print(colors.get(self.line, default_color) + f"{self.line} Line" + "\033[0m")
+        # furthest along the line (highest station index) first, unplaced trains last
+        for t_sorted in sorted(trains, key=lambda x: -x.axis_position if x.axis_position >= 0 else float("inf")):
             print(t_sorted)
-            # print((-northness(t_sorted), t_sorted.pct_distance_along_trip))
-        return out
+
+    def archive_trips(self, api_dict):
+        # one CSV row per trip status, appended so the file grows across polls
+        poll_time = round(time.time())
+        direction_ids = {trip["id"]: trip["directionId"] for trip in api_dict["data"]["references"]["trips"]}
+        rows = []
+        for trip in api_dict["data"]["list"]:
+            status = trip.get("status")
+            if not status:
+                continue
+            try:
+                _, next_station_index = self.get_next_station(trip)
+            except KeyError:
+                next_station_index = -1
+            rows.append((
+                poll_time,
+                self.line,
+                trip["tripId"],
+                status.get("vehicleId", ""),
+                direction_ids.get(trip["tripId"], -1),
+                next_station_index,
+                status.get("distanceAlongTrip", status.get("scheduledDistanceAlongTrip", 0)),
+                status.get("totalDistanceAlongTrip", 0),
+                status.get("scheduleDeviation", 0),
+                status.get("lastUpdateTime", 0) // 1000
+            ))
+        new_file = not os.path.exists(self.archive)
+        with open(self.archive, "a", newline="") as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(ARCHIVE_FIELDS)
+            writer.writerows(rows)
 
     def get_leg_time(self, trip_dict):
         # tolerant lookup: if schedule or nextStop missing, return 0
@@ -225,12 +383,34 @@ class TrainGetter():
         updated = trip_dict["status"]["lastUpdateTime"] / 1000
         staleness = now - updated
         time_to_next_stop = max(trip_dict["status"]["nextStopTimeOffset"] - staleness, 0)
+        estimated = False
 
         trip_id = trip_dict["tripId"]
         vehicle_id = trip_dict["status"]["vehicleId"]
-        if not vehicle_id:
-            vehicle_id = " " * 13 if args.line != 'T' else " " * 4
+        status = trip_dict["status"]
+        distance = status.get("distanceAlongTrip", status["scheduledDistanceAlongTrip"])
+        dwell_time = 0.0
         direction = self.get_direction(trip_id, api_dict)
+        if vehicle_id:
+            events = self.vehicle_state.update(vehicle_id, trip_id, updated, next_station_index, distance)
+            self.events.extend(events)
+            dwell_time = self.vehicle_state.dwell_time(vehicle_id, now)
+            if self.eta_model:
+                self.learn(events)
+                if staleness > STALE_AFTER or (time_to_next_stop == 0 and status["nextStopTimeOffset"] > 0):
+                    # the feed's prediction has run out, fall back to the learned model
+                    estimate = self.estimate_next_stop(vehicle_id, direction, next_station_index, now)
+                    if estimate is not None:
+                        next_station_index, arrival = estimate
+                        next_station_name = self.station_names[next_station_index]
+                        time_to_next_stop = max(arrival - now, 0)
+                        estimated = True
+        else:
+            vehicle_id = " " * 13 if self.line != 'T' else " " * 4
+        next_etas = self.get_next_etas(direction, next_station_index, now + time_to_next_stop, now)
+        # an estimated next stop may be past the last reported position, place it by time
+        axis_position = self.get_axis_position(trip_dict, direction, next_station_index, distance, time_to_next_stop,
+                                               by_time=estimated)
 
         # compare direction to the selected endpoint
         if direction == self.endpoint_name:
@@ -246,16 +426,223 @@ class TrainGetter():
             next_station=next_station_name,
             time_until=time_to_next_stop,
             leg_total=self.get_leg_time(trip_dict),
-            pct_distance_along_trip=pct_distance_along_trip
+            pct_distance_along_trip=pct_distance_along_trip,
+            dwell_time=dwell_time,
+            line=self.line,
+            estimated=estimated,
+            next_etas=next_etas,
+            axis_position=axis_position
         )
 
+    def get_axis_position(self, trip_dict, direction, next_station_index, distance, time_to_next_stop,
+                          by_time=False):
+        schedule = trip_dict.get("schedule") or {}
+        if (not by_time and
+                self.axis.register_trip(trip_dict["tripId"], schedule.get("stopTimes"), self.stop_id_to_name)):
+            return self.axis.project(trip_dict["tripId"], distance)
+        if next_station_index < 0:
+            return -1.0
+        up = direction == self.endpoint_name
+        # no schedule (bulk mode): the share of the trip already covered, kept on the leg
+        # into the next station so it agrees with the feed's next stop
+        total = trip_dict["status"].get("totalDistanceAlongTrip") or 0
+        if total > 0 and not by_time:
+            return self.axis.project_by_fraction(next_station_index, distance / total, up)
+        # nothing about distances: time left against the leg's learned or typical travel time
+        leg = self.axis.leg_length(next_station_index, up) / TYPICAL_SPEED
+        if self.eta_model:
+            previous = next_station_index - 1 if up else next_station_index + 1
+            leg = self.eta_model.travel_time(self.line, previous, next_station_index, time.time()) or leg
+        fraction_left = min(max(time_to_next_stop / leg, 0.0), 1.0) if leg > 0 else 0.0
+        return self.axis.project_by_stop(next_station_index, fraction_left, up)
+
+    def set_spacing(self, trains):
+        # distance to the train ahead, per direction, along the line axis; left at -1
+        # when the axis is only evenly spaced stations (stops-for-route unavailable)
+        if not self.axis.measured:
+            return
+        by_direction = {}
+        for t in trains:
+            if t.axis_position >= 0:
+                by_direction.setdefault(t.direction, []).append(t)
+        for direction, group in by_direction.items():
+            up = direction == self.endpoint_name
+            group.sort(key=lambda t: t.axis_position, reverse=up)
+            for ahead, t in zip(group, group[1:]):
+                t.gap_ahead = abs(ahead.axis_position - t.axis_position)
+
+    def estimate_next_stop(self, vehicle_id, direction, next_station_index, now):
+        """(station index, arrival) of the first stop still ahead by the learned model, or None.
+
+        Starts from the vehicle's last passage and walks on past stops the model says it
+        has reached since, so a long-stale vehicle is not held at a stop it already left.
+        """
+        passed_index, passed_time = self.vehicle_state.last_passage(vehicle_id)
+        if passed_index < 0 or next_station_index < 0:
+            return None
+        arrival = self.eta_model.arrival_after_passage(self.line, passed_index, passed_time, next_station_index)
+        if arrival is None:
+            return None
+        step = 1 if direction == self.endpoint_name else -1
+        index = next_station_index
+        while arrival < now and 0 <= index + step < len(self.station_names):
+            predicted = self.eta_model.predict(self.line, [index, index + step], arrival)
+            if not predicted:
+                break  # nothing learned beyond this stop
+            index, arrival = index + step, predicted[0]
+        return index, arrival
+
+    def learn(self, events):
+        for event in events:
+            if event.kind == "stop_passed" and abs(event.stop_index - event.previous_stop) == 1:
+                self.eta_model.observe_travel(self.line, event.previous_stop, event.stop_index, event.duration, event.time)
+            elif event.kind == "dwell_end" and event.stop_index >= 0:
+                self.eta_model.observe_dwell(self.line, event.stop_index, event.duration, event.time)
+
+    def get_next_etas(self, direction, next_station_index, next_arrival, now):
+        if not self.eta_model or not self.next_stops or next_station_index < 0:
+            return []
+        step = 1 if direction == self.endpoint_name else -1
+        stops = [next_station_index + k * step for k in range(self.next_stops + 1)]
+        stops = [i for i in stops if 0 <= i < len(self.station_names)]
+        arrivals = self.eta_model.predict(self.line, stops, next_arrival)
+        return [(self.station_names[i], arrival - now) for i, arrival in zip(stops[1:], arrivals)]
+
+class BulkTrainGetter():
+    """Whole-agency mode: one vehicles-for-agency response feeds a TrainGetter per route."""
+
+    def __init__(self, archive=None, eta_model=None, next_stops=3, map_view=False, subscriptions=None,
+                 output=None, topology_cache=TOPOLOGY_CACHE_DIR, quiet=False) -> None:
+        self.archive = archive
+        self.quiet = quiet
+        self.topology_cache = topology_cache
+        self.output = output
+        self.subscriptions = subscriptions
+        self.map_view = map_view
+        self.eta_model = eta_model
+        self.next_stops = next_stops
+        self.route_id_to_line = {route_id: line for line, route_id in line_to_route_id.items()}
+        # created on first sight of a route, reused for every later poll
+        self.getters: Dict[str, TrainGetter] = {}
+        # route id -> time after which a failed stops-for-route request is retried
+        self.retry_at: Dict[str, float] = {}
+
+    def getter_for(self, route_id) -> Optional[TrainGetter]:
+        """Getter of a route, or None while its stops are unavailable (retried after a backoff)."""
+        getter = self.getters.get(route_id)
+        if getter is None:
+            if time.time() < self.retry_at.get(route_id, 0):
+                return None
+            line = self.route_id_to_line.get(route_id, route_id)
+            try:
+                topology = load_topology(route_id, stops_for_route_url(route_id), cache_dir=self.topology_cache)
+            except Exception:
+                self.retry_at[route_id] = time.time() + TOPOLOGY_RETRY
+                raise
+            self.retry_at.pop(route_id, None)
+            link = line in line_stations
+            # only Link lines are printed and archived, other routes are tracked quietly
+            getter = TrainGetter(line, archive=self.archive if link else None,
+                                 topology=topology, quiet=self.quiet or not link,
+                                 eta_model=self.eta_model, next_stops=self.next_stops,
+                                 map_view=self.map_view, subscriptions=self.subscriptions,
+                                 output=self.output)
+            self.getters[route_id] = getter
+        return getter
+
+    def get_trains(self, json_str) -> Dict[str, List[Train]]:
+        api_dict = json.loads(json_str)
+        references = api_dict["data"]["references"]
+        trip_refs = {trip["id"]: trip for trip in references["trips"]}
+
+        # regroup vehicles into trips-for-route shaped responses, one per route
+        by_route = {}
+        for vehicle in api_dict["data"]["list"]:
+            trip_id = vehicle.get("tripId")
+            status = vehicle.get("tripStatus")
+            if not trip_id or not status or trip_id not in trip_refs:
+                continue  # vehicle not in service
+            route_id = trip_refs[trip_id]["routeId"]
+            route = by_route.setdefault(route_id, {"list": [], "trips": []})
+            route["list"].append({"tripId": trip_id, "status": status})
+            route["trips"].append(trip_refs[trip_id])
+
+        # Link lines first, in their usual order
+        link_order = list(line_to_route_id.values())
+        ordered = sorted(by_route, key=lambda r: (link_order.index(r) if r in link_order else len(link_order), r))
+        out = {}
+        for route_id in ordered:
+            route = by_route[route_id]
+            try:
+                getter = self.getter_for(route_id)
+            except Exception as e:
+                message = f"Error loading stops for route {route_id}, skipping for {TOPOLOGY_RETRY} s: {e}"
+                if self.output:
+                    self.output.error(message, line=self.route_id_to_line.get(route_id, route_id), route_id=route_id)
+                else:
+                    print(message)
+                continue
+            if getter is None:
+                continue  # stops failed to load recently, not retried yet
+            out[route_id] = getter.get_trains_from_dict({"data": {
+                "list": route["list"],
+                "references": {"trips": route["trips"], "stops": references.get("stops", [])}
+            }})
+        return out
+
 if __name__ == "__main__":
+    args = parser.parse_args()
+    if args.api_base:
+        api_base = args.api_base.rstrip("/")
+    eta_model = EtaModel()
+    output = NdjsonWriter() if args.json else None
+    subscriptions = None
+    if args.watches:
+        subscriptions = SubscriptionEngine([make_sink(spec) for spec in args.notify])
+        for watch in load_watches(args.watches):
+            subscriptions.add(watch)
+    if args.bulk:
+        url = vehicles_for_agency_url(agency_id)
+        traingetter = BulkTrainGetter(archive=args.archive, eta_model=eta_model, next_stops=args.next_stops,
+                                      map_view=args.map, subscriptions=subscriptions, output=output)
+    else:
+        route_id = line_to_route_id[args.line]
+        url = trips_for_route_url(route_id)
+        try:
+            topology = load_topology(route_id, stops_for_route_url(route_id))
+        except Exception:
+            topology = None  # positions fall back to evenly spaced stations
+        traingetter = TrainGetter(args.line, archive=args.archive, topology=topology, eta_model=eta_model,
+                                  next_stops=args.next_stops, map_view=args.map, subscriptions=subscriptions,
+                                  output=output)
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        traingetter = TrainGetter()
-        traingetter.get_trains(json_str=response.text)
-
-    except:
-        print("Request failed")
-        sys.exit(1)
+        while True:
+            if output:
+                output.begin()
+            try:
+                response = requests.get(url)
+                response.raise_for_status()
+                if args.map and args.interval and not output:
+                    # redraw the map in place
+                    print("\033[H\033[2J", end="")
+                traingetter.get_trains(json_str=response.text)
+
+            except Exception as e:
+                if output:
+                    output.error(f"Request failed: {e}")
+                else:
+                    print("Request failed")
+                if not args.interval:
+                    if output:
+                        output.flush()
+                    sys.exit(1)
+            if output:
+                # one write per snapshot
+                output.flush()
+            if not args.interval:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        eta_model.save()
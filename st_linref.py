@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+import math
+from bisect import bisect_right
+from typing import Dict, List, Optional, Sequence, Tuple
+
+EARTH_RADIUS = 6371000.0
+MAX_OFFSET = 200.0         # metres a station may lie off the shape before the shape is distrusted
+DEFAULT_SPACING = 1000.0   # metres between stations when nothing better is known
+
+def decode_polyline(points: str) -> List[Tuple[float, float]]:
+    """Decode a Google encoded polyline into (lat, lon) pairs."""
+    coords = []
+    index = lat = lon = 0
+    while index < len(points):
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                b = ord(points[index]) - 63
+                index += 1
+                result |= (b & 0x1f) << shift
+                shift += 5
+                if b < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lon += deltas[1]
+        coords.append((lat / 1e5, lon / 1e5))
+    return coords
+
+def _project_xy(coords, lat0: float) -> List[Tuple[float, float]]:
+    # local equirectangular metres, plenty for a few tens of kilometres
+    k = math.pi / 180 * EARTH_RADIUS
+    c = math.cos(math.radians(lat0))
+    return [(lon * k * c, lat * k) for lat, lon in coords]
+
+def _cumulative(xy) -> List[float]:
+    cum = [0.0]
+    for (x0, y0), (x1, y1) in zip(xy, xy[1:]):
+        cum.append(cum[-1] + math.hypot(x1 - x0, y1 - y0))
+    return cum
+
+def _locate(xy, cum, point) -> Tuple[float, float]:
+    """(distance along the polyline, offset from it) of the closest point."""
+    px, py = point
+    best = (0.0, float("inf"))
+    for i, ((x0, y0), (x1, y1)) in enumerate(zip(xy, xy[1:])):
+        dx, dy = x1 - x0, y1 - y0
+        seg2 = dx * dx + dy * dy
+        t = 0.0 if seg2 == 0 else min(max(((px - x0) * dx + (py - y0) * dy) / seg2, 0.0), 1.0)
+        offset = math.hypot(px - (x0 + t * dx), py - (y0 + t * dy))
+        if offset < best[1]:
+            best = (cum[i] + t * (cum[i + 1] - cum[i]), offset)
+    return best
+
+class LineAxis():
+    """One distance axis per line, station 0 at 0 m, increasing with the station index.
+
+    Station positions are precomputed from the route shape; a train is placed by
+    bisecting its trip's stop distances, so each projection is O(log stops).
+    """
+
+    def __init__(self, station_names: Sequence[str], topology=None) -> None:
+        self.station_names = list(station_names)
+        self.name_to_index = {name: i for i, name in enumerate(self.station_names)}
+        # False when station positions are evenly spaced placeholders, not distances
+        self.measured = True
+        self.station_axis = self._station_positions(topology)
+        # trip id -> (stop distances along the trip, station index of each stop)
+        self._trips: Dict[str, Tuple[List[float], List[int]]] = {}
+
+    def _station_positions(self, topology) -> List[float]:
+        n = len(self.station_names)
+        fallback = [i * DEFAULT_SPACING for i in range(n)]
+        if topology is None or not topology.stop_coords:
+            self.measured = False
+            return fallback
+        # a station has a platform stop per direction; use their midpoint
+        sums: Dict[str, List[float]] = {}
+        for stop_id, (lat, lon) in topology.stop_coords.items():
+            name = topology.stop_id_to_name.get(stop_id)
+            if name in self.name_to_index:
+                acc = sums.setdefault(name, [0.0, 0.0, 0])
+                acc[0] += lat
+                acc[1] += lon
+                acc[2] += 1
+        if len(sums) != n:
+            self.measured = False
+            return fallback
+        station_coords = [(sums[name][0] / sums[name][2], sums[name][1] / sums[name][2])
+                          for name in self.station_names]
+        lat0 = station_coords[0][0]
+        stations_xy = _project_xy(station_coords, lat0)
+
+        positions = None
+        shapes = [decode_polyline(p) for p in topology.polylines]
+        shapes = [s for s in shapes if len(s) > 1]
+        if shapes:
+            xy = _project_xy(max(shapes, key=len), lat0)
+            cum = _cumulative(xy)
+            located = [_locate(xy, cum, p) for p in stations_xy]
+            if all(offset <= MAX_OFFSET for _, offset in located):
+                positions = [d for d, _ in located]
+                if positions[-1] < positions[0]:
+                    # the shape runs from the last station to the first
+                    positions = [cum[-1] - d for d in positions]
+                if any(b <= a for a, b in zip(positions, positions[1:])):
+                    positions = None  # shape loops or doubles back, not usable as an axis
+        if positions is None:
+            # straight lines between consecutive stations
+            positions = _cumulative(stations_xy)
+        return [p - positions[0] for p in positions]
+
+    def register_trip(self, trip_id: str, stop_times, stop_id_to_name) -> bool:
+        """Remember the stop distances of a trip from its schedule; False if unusable."""
+        if trip_id in self._trips:
+            return True
+        distances, indexes = [], []
+        for st in stop_times or []:
+            index = self.name_to_index.get(stop_id_to_name.get(st.get("stopId")))
+            d = st.get("distanceAlongTrip")
+            if index is None or d is None or (distances and d <= distances[-1]):
+                continue
+            distances.append(d)
+            indexes.append(index)
+        if len(distances) < 2:
+            return False
+        self._trips[trip_id] = (distances, indexes)
+        return True
+
+    def forget_trips(self, keep) -> None:
+        for trip_id in [t for t in self._trips if t not in keep]:
+            del self._trips[trip_id]
+
+    def project(self, trip_id: str, distance_along_trip: float) -> Optional[float]:
+        """Position on the line axis of a vehicle on a registered trip, or None."""
+        trip = self._trips.get(trip_id)
+        if trip is None:
+            return None
+        distances, indexes = trip
+        j = min(max(bisect_right(distances, distance_along_trip), 1), len(distances) - 1)
+        d0, d1 = distances[j - 1], distances[j]
+        frac = min(max((distance_along_trip - d0) / (d1 - d0), 0.0), 1.0)
+        a0, a1 = self.station_axis[indexes[j - 1]], self.station_axis[indexes[j]]
+        return a0 + frac * (a1 - a0)
+
+    def project_by_stop(self, next_station_index: int, fraction_left: float, up: bool) -> float:
+        """Position from the next station and the share of the leg still ahead (no schedule)."""
+        i = next_station_index
+        other = i - 1 if up else i + 1
+        if not 0 <= other < len(self.station_axis):
+            return self.station_axis[i]
+        return self.station_axis[i] + fraction_left * (self.station_axis[other] - self.station_axis[i])
+
+    def leg_length(self, next_station_index: int, up: bool) -> float:
+        """Metres of the leg ending at next_station_index, 0 at the start of the line."""
+        other = next_station_index - 1 if up else next_station_index + 1
+        if not 0 <= other < len(self.station_axis):
+            return 0.0
+        return abs(self.station_axis[next_station_index] - self.station_axis[other])
+
+    def project_by_fraction(self, next_station_index: int, trip_fraction: float, up: bool) -> float:
+        """Position from the share of the whole line covered, kept on the leg into the next station."""
+        axis = self.station_axis
+        trip_fraction = min(max(trip_fraction, 0.0), 1.0)
+        p = axis[0] + (trip_fraction if up else 1.0 - trip_fraction) * (axis[-1] - axis[0])
+        other = next_station_index - 1 if up else next_station_index + 1
+        if not 0 <= other < len(axis):
+            return axis[next_station_index]
+        lo, hi = sorted((axis[other], axis[next_station_index]))
+        return min(max(p, lo), hi)
+
+    def station_position(self, axis_position: float) -> float:
+        """Fractional station index of an axis position."""
+        axis = self.station_axis
+        if len(axis) < 2:
+            return 0.0
+        i = min(max(bisect_right(axis, axis_position), 1), len(axis) - 1)
+        a0, a1 = axis[i - 1], axis[i]
+        frac = min(max((axis_position - a0) / (a1 - a0), 0.0), 1.0)
+        return i - 1 + frac
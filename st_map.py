@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+
+import shutil
+from dataclasses import dataclass
+from typing import Dict, List, Sequence
+
+MIN_SPACING = 3       # columns between neighbouring stations
+LABEL_ROWS = 3        # station labels are staggered over this many rows,
+MAX_LABEL_ROWS = 5    # or up to this many when names would be cut otherwise
+UP_GLYPH = "▶"        # towards the highest station index
+DOWN_GLYPH = "◀"
+GLYPH_COLOR = "\033[1;33m"
+RESET = "\033[0m"
+
+@dataclass
+class MapLayout():
+    """Static part of a strip map for one line at one terminal width."""
+    width: int
+    # rows of each band, with up/down lane rows left empty for the trains
+    band_rows: List[List[str]]
+    # per segment i (station i to i+1): band and the columns of both ends
+    seg_band: List[int]
+    seg_col0: List[int]
+    seg_col1: List[int]
+
+def _bands(n: int, width: int, min_bands: int = 1) -> List[List[int]]:
+    # consecutive bands share their boundary station so every segment sits in one band
+    max_segments = max(1, (width - 1) // MIN_SPACING)
+    segments = max(n - 1, 1)
+    n_bands = min(max(-(-segments // max_segments), min_bands), segments)
+    bands = []
+    start = 0
+    for b in range(n_bands):
+        # spread segments evenly so the last band is not nearly empty
+        size = segments // n_bands + (b < segments % n_bands)
+        bands.append(list(range(start, min(start + size + 1, n))))
+        start += size
+    return bands
+
+def _place_labels(names: Sequence[str], cols: Sequence[int], width: int, rows: int):
+    """(characters cut, label rows) with names staggered over rows under their stations."""
+    out = [[" "] * width for _ in range(rows)]
+    cut = 0
+    for r in range(rows):
+        row = list(range(r, len(names), rows))
+        # right to left: each label starts at its station, sliding left only as far as
+        # needed to leave room for the labels after it, so the end station keeps its name
+        planned = {}
+        limit = width
+        for j in reversed(row):
+            planned[j] = max(0, min(cols[j], limit - len(names[j])))
+            limit = planned[j] - 1
+        # left to right: labels squeezed against the line start are cut before the next one
+        end = -1
+        for k, j in enumerate(row):
+            start = max(planned[j], end + 1)
+            stop = planned[row[k + 1]] - 1 if k + 1 < len(row) else width
+            text = names[j][:max(stop - start, 1)]
+            cut += len(names[j]) - len(text)
+            out[r][start:start + len(text)] = list(text)
+            end = start + len(text)
+    return cut, ["".join(row).rstrip() for row in out]
+
+def build_layout(station_names: Sequence[str], color: str, width: int) -> MapLayout:
+    n = len(station_names)
+    width = max(width, 2 * MIN_SPACING)
+    # add bands until every name fits, so crowded lines wrap instead of losing their labels
+    n_bands = len(_bands(n, width))
+    while True:
+        layout, cut = _layout(station_names, color, width, _bands(n, width, n_bands))
+        if not cut or n_bands >= max(n - 1, 1):
+            return layout
+        n_bands += 1
+
+def _layout(station_names: Sequence[str], color: str, width: int, bands: List[List[int]]):
+    n = len(station_names)
+    seg_band = [0] * max(n - 1, 0)
+    seg_col0 = [0] * max(n - 1, 0)
+    seg_col1 = [0] * max(n - 1, 0)
+    band_rows = []
+    total_cut = 0
+    for b, band in enumerate(bands):
+        span = width - 1
+        cols = ([round(j * span / (len(band) - 1)) for j in range(len(band))]
+                if len(band) > 1 else [0])
+        for j, i in enumerate(band[:-1]):
+            seg_band[i] = b
+            seg_col0[i] = cols[j]
+            seg_col1[i] = cols[j + 1]
+
+        track = ["━"] * width
+        for c in cols:
+            track[c] = "●"
+        # fewest cut characters, then fewest rows
+        names = [station_names[i] for i in band]
+        cut, labels = min(_place_labels(names, cols, width, rows)
+                          for rows in range(LABEL_ROWS, MAX_LABEL_ROWS + 1))
+        total_cut += cut
+        band_rows.append([color + "".join(track) + RESET] + labels)
+    return MapLayout(width, band_rows, seg_band, seg_col0, seg_col1), total_cut
+
+class LineMap():
+    """Strip map of one line; layouts are cached per width, frames only place trains."""
+
+    def __init__(self, line: str, station_names: Sequence[str], color: str, up_direction: str, axis=None) -> None:
+        self.line = line
+        self.station_names = list(station_names)
+        self.color = color
+        # Train.direction value of trains heading to the highest station index
+        self.up_direction = up_direction
+        # st_linref.LineAxis; trains with an axis position are placed by it
+        self.axis = axis
+        self._layouts: Dict[int, MapLayout] = {}
+
+    def layout(self, width: int) -> MapLayout:
+        layout = self._layouts.get(width)
+        if layout is None:
+            layout = self._layouts[width] = build_layout(self.station_names, self.color, width)
+        return layout
+
+    def position(self, train) -> float:
+        """Fractional station index of a train, from its next stop and time left on the leg."""
+        if self.axis is not None and getattr(train, "axis_position", -1) >= 0:
+            return self.axis.station_position(train.axis_position)
+        remaining = 0.0
+        if train.leg_total and train.leg_total > 0:
+            remaining = min(max(train.time_until / train.leg_total, 0.0), 1.0)
+        if train.direction == self.up_direction:
+            p = train.next_station_index - remaining
+        else:
+            p = train.next_station_index + remaining
+        return min(max(p, 0.0), len(self.station_names) - 1.0)
+
+    def render(self, trains, width: int = 0) -> str:
+        width = width or shutil.get_terminal_size().columns
+        layout = self.layout(width)
+        n_bands = len(layout.band_rows)
+        up_lanes = [[" "] * layout.width for _ in range(n_bands)]
+        down_lanes = [[" "] * layout.width for _ in range(n_bands)]
+        counts = {}
+        last = len(self.station_names) - 1
+        for train in trains:
+            if train.next_station_index < 0 or last < 1:
+                continue
+            p = self.position(train)
+            i = min(int(p), last - 1)
+            band = layout.seg_band[i]
+            c0, c1 = layout.seg_col0[i], layout.seg_col1[i]
+            col = round(c0 + (p - i) * (c1 - c0))
+            up = train.direction == self.up_direction
+            lane = (up_lanes if up else down_lanes)[band]
+            key = (band, up, col)
+            counts[key] = counts.get(key, 0) + 1
+            glyph = (UP_GLYPH if up else DOWN_GLYPH) if counts[key] == 1 else str(min(counts[key], 9))
+            lane[col] = GLYPH_COLOR + glyph + RESET
+
+        out = [self.color + f"{self.line} Line" + RESET]
+        for band, rows in enumerate(layout.band_rows):
+            out.append("".join(up_lanes[band]).rstrip())
+            out.append(rows[0])
+            out.append("".join(down_lanes[band]).rstrip())
+            out.extend(rows[1:])
+        return "\n".join(out)
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+
+import sys
+import json
+import time
+
+# bump when a field is renamed or removed; adding fields keeps the version
+SCHEMA_VERSION = 1
+
+class NdjsonWriter():
+    """Buffers one JSON object per record and writes them all at once per snapshot.
+
+    Every record of a snapshot carries the same ``snapshot`` number and ``time``
+    (when the poll started); a snapshot ends with flush().
+    """
+
+    def __init__(self, stream=None) -> None:
+        self.stream = stream or sys.stdout
+        self._lines = []
+        self.snapshot = 0
+        self._time = None
+
+    def begin(self, poll_time=None) -> None:
+        """Start a snapshot; called implicitly by the first add() after a flush."""
+        self.snapshot += 1
+        self._time = round(time.time() if poll_time is None else poll_time, 3)
+
+    def add(self, record_type: str, **fields) -> None:
+        if self._time is None:
+            self.begin()
+        record = {"schema": SCHEMA_VERSION, "type": record_type, "snapshot": self.snapshot, "time": self._time}
+        record.update(fields)
+        self._lines.append(json.dumps(record, separators=(",", ":")))
+
+    def error(self, message: str, line=None, route_id=None, trip_id=None) -> None:
+        # every error record has the same fields, null where they do not apply
+        self.add("error", line=line, route_id=route_id, trip_id=trip_id, message=message)
+
+    def flush(self) -> None:
+        self._time = None
+        if not self._lines:
+            return
+        self.stream.write("\n".join(self._lines) + "\n")
+        self.stream.flush()
+        self._lines = []
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+import json
+import socket
+import time
+from bisect import bisect_left
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+@dataclass
+class Watch():
+    id: str
+    line: str
+    stop: str          # station name as shown by st_link.py
+    direction: str     # Train.direction, surrounding spaces ignored (e.g. "N", "Lynnwood")
+    threshold: float   # notify once the train is this many seconds away or closer
+
+@dataclass
+class Notification():
+    watch_id: str
+    line: str
+    stop: str
+    direction: str
+    trip_id: str
+    vehicle_id: str
+    eta: float
+    threshold: float
+    time: float
+
+class FileSink():
+    """Appends one JSON object per notification to a file."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def deliver(self, notifications: List[Notification]) -> None:
+        with open(self.path, "a") as f:
+            f.write("".join(json.dumps(asdict(n)) + "\n" for n in notifications))
+
+class SocketSink():
+    """Sends one JSON datagram per notification to a local UDP or unix socket."""
+
+    def __init__(self, address) -> None:
+        self.address = address
+        family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+        self.sock = socket.socket(family, socket.SOCK_DGRAM)
+
+    def deliver(self, notifications: List[Notification]) -> None:
+        for n in notifications:
+            try:
+                self.sock.sendto(json.dumps(asdict(n)).encode(), self.address)
+            except OSError:
+                pass  # nobody listening; notifications are best effort
+
+def make_sink(spec: str):
+    """udp://host:port, unix:///path/to/socket or a file path."""
+    if spec.startswith("udp://"):
+        host, _, port = spec[len("udp://"):].rpartition(":")
+        return SocketSink((host or "127.0.0.1", int(port)))
+    if spec.startswith("unix://"):
+        return SocketSink(spec[len("unix://"):])
+    return FileSink(spec)
+
+def load_watches(path: str) -> List[Watch]:
+    # one JSON object per line with the Watch fields
+    with open(path) as f:
+        return [Watch(**json.loads(line)) for line in f if line.strip()]
+
+class SubscriptionEngine():
+    """Finds the watches whose threshold a train newly crossed since the previous snapshot.
+
+    Watches are indexed by (line, stop, direction) with thresholds kept sorted,
+    so a snapshot costs O(trains * stops ahead * log watches) plus the matches.
+    """
+
+    def __init__(self, sinks=None) -> None:
+        self.sinks = list(sinks or [])
+        # (line, stop, direction) -> sorted thresholds and the watches in the same order
+        self._thresholds: Dict[Tuple[str, str, str], List[float]] = {}
+        self._watches: Dict[Tuple[str, str, str], List[Watch]] = {}
+        self._unsorted: Set[Tuple[str, str, str]] = set()
+        # trip -> {stop: last ETA}, and the watch ids already fired for each trip
+        self._last_eta: Dict[str, Dict[str, float]] = {}
+        self._fired: Dict[str, Set[str]] = {}
+        self._trips_by_line: Dict[str, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return sum(len(w) for w in self._watches.values())
+
+    def add(self, watch: Watch) -> None:
+        key = (watch.line, watch.stop, watch.direction.strip())
+        self._watches.setdefault(key, []).append(watch)
+        self._thresholds.setdefault(key, []).append(watch.threshold)
+        # sorted lazily, so bulk loading stays O(n log n)
+        self._unsorted.add(key)
+
+    def remove(self, watch_id: str) -> None:
+        for key, watches in self._watches.items():
+            kept = [w for w in watches if w.id != watch_id]
+            if len(kept) != len(watches):
+                self._watches[key] = kept
+                self._thresholds[key] = [w.threshold for w in kept]
+
+    def _sort(self) -> None:
+        for key in self._unsorted:
+            pairs = sorted(zip(self._thresholds[key], range(len(self._watches[key]))))
+            watches = self._watches[key]
+            self._watches[key] = [watches[i] for _, i in pairs]
+            self._thresholds[key] = [t for t, _ in pairs]
+        self._unsorted.clear()
+
+    def evaluate(self, line: str, trains, now: Optional[float] = None) -> List[Notification]:
+        """Check one line's snapshot of trains and deliver new notifications."""
+        now = time.time() if now is None else now
+        if self._unsorted:
+            self._sort()
+        out = []
+        seen = set()
+        previous_trips = self._trips_by_line.get(line, set())
+        for train in trains:
+            trip_id = train.id
+            seen.add(trip_id)
+            direction = train.direction.strip()
+            # a trip seen for the first time only primes its ETAs
+            known_trip = trip_id in previous_trips
+            last = self._last_eta.setdefault(trip_id, {})
+            fired = self._fired.setdefault(trip_id, set())
+            etas = [(train.next_station, train.time_until)] + list(getattr(train, "next_etas", []))
+            current = {}
+            for stop, eta in etas:
+                current[stop] = eta
+                key = (line, stop, direction)
+                thresholds = self._thresholds.get(key)
+                if not thresholds:
+                    continue
+                if stop in last:
+                    prev = last[stop]
+                elif known_trip:
+                    prev = float("inf")  # stop just came into the prediction horizon
+                else:
+                    continue
+                # crossed when eta <= threshold < prev
+                lo = bisect_left(thresholds, eta)
+                hi = bisect_left(thresholds, prev)
+                if lo >= hi:
+                    continue
+                watches = self._watches[key]
+                for i in range(lo, hi):
+                    watch = watches[i]
+                    if watch.id in fired:
+                        continue
+                    fired.add(watch.id)
+                    out.append(Notification(watch.id, line, stop, direction, trip_id,
+                                            train.vehicle_id.strip(), eta, watch.threshold, now))
+            self._last_eta[trip_id] = current
+
+        # forget trips that left the line so memory follows the live fleet
+        for trip_id in previous_trips - seen:
+            self._last_eta.pop(trip_id, None)
+            self._fired.pop(trip_id, None)
+        self._trips_by_line[line] = seen
+
+        if out:
+            for sink in self.sinks:
+                sink.deliver(out)
+        return out
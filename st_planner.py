@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+
+import sys
+import time
+import argparse
+import datetime
+import requests
+from bisect import bisect_left
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import st_link
+from st_link import line_stations, line_to_route_id, schedule_for_route_url, trips_for_route_url
+
+MIN_TRANSFER = 120     # seconds to change trains at a shared station
+HORIZON = 3 * 3600     # seconds of departures kept after now
+# station where the 1 and 2 Lines meet; the later stops are shared as well
+TRANSFER_STATIONS = {"Int'l Dist/Chinatown": MIN_TRANSFER}
+
+parser = argparse.ArgumentParser(description="Fastest Link trip between two stations, leaving now")
+parser.add_argument('origin', type=str, help='Station to leave from (name or unique prefix)')
+parser.add_argument('destination', type=str, help='Station to go to (name or unique prefix)')
+parser.add_argument('--at', type=str, default=None, help='Leave at HH:MM today instead of now')
+parser.add_argument('--api-base', type=str, default=None, help='OneBusAway API root to use instead of the Puget Sound server')
+
+@dataclass
+class Leg():
+    line: str
+    trip_id: str
+    board: str
+    departure: float
+    alight: str
+    arrival: float
+
+class StationGraph():
+    """Stations of all lines with stable ids; a name shared by two lines is one station."""
+
+    def __init__(self, lines: Dict[str, Dict[str, int]] = line_stations) -> None:
+        self.names: List[str] = []
+        self.ids: Dict[str, int] = {}
+        # line -> station id per station index
+        self.line_ids: Dict[str, List[int]] = {}
+        for line, name_to_index in lines.items():
+            ids = []
+            for name in sorted(name_to_index, key=name_to_index.get):
+                if name not in self.ids:
+                    self.ids[name] = len(self.names)
+                    self.names.append(name)
+                ids.append(self.ids[name])
+            self.line_ids[line] = ids
+        served = {}
+        for line, ids in self.line_ids.items():
+            for i in ids:
+                served.setdefault(i, set()).add(line)
+        # change time per station, 0 where only one line stops
+        self.transfer = [0] * len(self.names)
+        for i, lines_here in served.items():
+            if len(lines_here) > 1:
+                self.transfer[i] = TRANSFER_STATIONS.get(self.names[i], MIN_TRANSFER)
+
+    def find(self, query: str) -> int:
+        """Station id for an exact name or an unambiguous case-insensitive prefix."""
+        if query in self.ids:
+            return self.ids[query]
+        q = query.lower()
+        matches = [name for name in self.names if name.lower().startswith(q)]
+        if len(matches) != 1:
+            raise ValueError(f"{'Ambiguous' if matches else 'Unknown'} station {query!r}"
+                             + (f": {', '.join(matches)}" if matches else ""))
+        return self.ids[matches[0]]
+
+class Planner():
+    """Earliest-arrival search (connection scan) over live and scheduled departures.
+
+    The station graph is built once; per line, the timetable is replaced with
+    update_schedule() and the running trips with update_line(). Departures are kept
+    sorted, so a query is a single forward scan.
+    """
+
+    def __init__(self, graph: Optional[StationGraph] = None) -> None:
+        self.graph = graph or StationGraph()
+        # per line and trip id: list of (departure, arrival, from id, to id),
+        # from the timetable and from the trips currently running
+        self._scheduled: Dict[str, Dict[str, List[Tuple[float, float, int, int]]]] = {}
+        self._live: Dict[str, Dict[str, List[Tuple[float, float, int, int]]]] = {}
+        # (line, trip id) per trip key of the connections, rebuilt with them
+        self._trip_keys: List[Tuple[str, str]] = []
+        # (departure, arrival, from id, to id, trip key) in departure order
+        self._connections: List[Tuple[float, float, int, int, int]] = []
+        self._departures: List[float] = []
+
+    def _trip_connections(self, line: str, stop_times, stop_names, base: float):
+        """Connections between consecutive stations of one trip; stop times are seconds after base."""
+        ids = self.graph.ids
+        line_names = line_stations[line]
+        connections = []
+        prev = None
+        for st in stop_times:
+            name = stop_names.get(st.get("stopId"))
+            if name not in line_names:
+                prev = None
+                continue
+            arrival = base + st.get("arrivalTime", 0)
+            departure = base + st.get("departureTime", st.get("arrivalTime", 0))
+            if prev is not None:
+                prev_id, prev_departure = prev
+                connections.append((prev_departure, arrival, prev_id, ids[name]))
+            prev = (ids[name], departure)
+        return connections
+
+    def update_line(self, line: str, api_dict, now: Optional[float] = None) -> None:
+        """Replace the live departures of one line from a trips-for-route response with schedules."""
+        stop_names = {stop["id"]: stop["name"] for stop in api_dict["data"]["references"]["stops"]}
+        live = {}
+        for trip in api_dict["data"]["list"]:
+            stop_times = (trip.get("schedule") or {}).get("stopTimes") or []
+            if not stop_times:
+                continue
+            status = trip.get("status") or {}
+            service_date = trip.get("serviceDate", status.get("serviceDate", 0)) / 1000
+            # live: shift the timetable by the vehicle's current deviation
+            deviation = status.get("scheduleDeviation", 0)
+            live[trip["tripId"]] = self._trip_connections(line, stop_times, stop_names, service_date + deviation)
+        self._live[line] = live
+        self._rebuild(now)
+
+    def update_schedule(self, line: str, api_dict, now: Optional[float] = None) -> None:
+        """Replace the timetable of one line from a schedule-for-route response."""
+        data = api_dict["data"]
+        stop_names = {stop["id"]: stop["name"] for stop in data["references"]["stops"]}
+        entry = data["entry"]
+        service_date = entry.get("scheduleDate", 0) / 1000
+
+        def absolute(t):
+            # epoch milliseconds, or seconds after the service date
+            return t / 1000 if t > 1e11 else service_date + t
+
+        scheduled = {}
+        for grouping in entry.get("stopTripGroupings", []):
+            for trip in grouping.get("tripsWithStopTimes", []):
+                stop_times = [{"stopId": st.get("stopId"),
+                               "arrivalTime": absolute(st.get("arrivalTime", 0)),
+                               "departureTime": absolute(st.get("departureTime", st.get("arrivalTime", 0)))}
+                              for st in trip.get("stopTimes") or []]
+                stop_times.sort(key=lambda st: st["arrivalTime"])
+                scheduled[trip["tripId"]] = self._trip_connections(line, stop_times, stop_names, 0)
+        self._scheduled[line] = scheduled
+        self._rebuild(now)
+
+    def _rebuild(self, now: Optional[float]) -> None:
+        now = time.time() if now is None else now
+        connections = []
+        # keys are handed out again on every rebuild, so trips that left the feed or
+        # the timetable do not pile up in a long-lived planner
+        self._trip_keys = []
+        for line in self._scheduled.keys() | self._live.keys():
+            live = self._live.get(line, {})
+            # a running trip replaces its timetable entry; trips not started yet keep the timetable
+            trips = list(live.items()) + [(trip_id, conns) for trip_id, conns in self._scheduled.get(line, {}).items()
+                                          if trip_id not in live]
+            for trip_id, conns in trips:
+                ahead = [c for c in conns if now <= c[0] <= now + HORIZON]
+                if ahead:
+                    key = len(self._trip_keys)
+                    self._trip_keys.append((line, trip_id))
+                    connections.extend(c + (key,) for c in ahead)
+        self._connections = sorted(connections)
+        self._departures = [c[0] for c in self._connections]
+
+    def query(self, origin: int, destination: int, depart_at: float) -> Optional[List[Leg]]:
+        """Legs of the earliest-arriving journey, or None if nothing gets there in the horizon."""
+        n = len(self.graph.names)
+        inf = float("inf")
+        arrival = [inf] * n
+        ready = [inf] * n        # earliest time to board a train at a station
+        arrival[origin] = ready[origin] = depart_at
+        boarded: Dict[int, int] = {}          # trip key -> connection index it was boarded at
+        ridden: Dict[int, List[int]] = {}     # trip key -> connections taken since boarding
+        came_by: Dict[int, Tuple[int, int]] = {}  # station -> (boarding, alighting connection)
+        transfer = self.graph.transfer
+        conns = self._connections
+        for c in range(bisect_left(self._departures, depart_at), len(conns)):
+            dep, arr, a, b, trip = conns[c]
+            if dep >= arrival[destination]:
+                break  # later departures cannot arrive earlier
+            if trip not in boarded:
+                if ready[a] > dep:
+                    continue
+                boarded[trip] = c
+            ridden.setdefault(trip, []).append(c)
+            if arr < arrival[b]:
+                arrival[b] = arr
+                ready[b] = arr + transfer[b]
+                came_by[b] = (boarded[trip], c)
+        if arrival[destination] == inf:
+            return None
+
+        legs = []
+        station = destination
+        while station != origin:
+            _, alight = came_by[station]
+            board = self._latest_boarding(ridden[conns[alight][4]], alight, origin, ready, came_by)
+            dep, _, a, _, trip = conns[board]
+            line, trip_id = self._trip_keys[trip]
+            legs.append(Leg(line, trip_id, self.graph.names[a], dep,
+                            self.graph.names[station], conns[alight][1]))
+            station = a
+        legs.reverse()
+        return legs
+
+    def _latest_boarding(self, ridden: List[int], alight: int, origin: int, ready, came_by) -> int:
+        # the trip is boarded where it is first reachable; for the same arrival, board as late
+        # as possible instead (change at Int'l Dist rather than ride on and come back)
+        conns = self._connections
+        trip = conns[alight][4]
+        for c in reversed(ridden):
+            if c > alight:
+                continue
+            dep, _, a, _, _ = conns[c]
+            if a == origin or (ready[a] <= dep and conns[came_by[a][1]][4] != trip):
+                return c
+        return ridden[0]
+
+def _clock(t: float) -> str:
+    return datetime.datetime.fromtimestamp(t).strftime("%H:%M")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    if args.api_base:
+        st_link.api_base = args.api_base.rstrip("/")
+    planner = Planner()
+    try:
+        origin = planner.graph.find(args.origin)
+        destination = planner.graph.find(args.destination)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    if origin == destination:
+        print("Origin and destination are the same station")
+        sys.exit(1)
+    depart_at = time.time()
+    if args.at:
+        try:
+            hh, mm = map(int, args.at.split(":"))
+            depart_at = datetime.datetime.now().replace(hour=hh, minute=mm, second=0, microsecond=0).timestamp()
+        except ValueError:
+            parser.error(f"--at expects a time of day as HH:MM, got {args.at!r}")
+
+    date = datetime.date.fromtimestamp(depart_at).isoformat()
+    for line, route_id in line_to_route_id.items():
+        try:
+            response = requests.get(schedule_for_route_url(route_id, date), timeout=10)
+            response.raise_for_status()
+            planner.update_schedule(line, response.json(), now=depart_at)
+        except Exception as e:
+            print(f"No timetable for the {line} Line, using running trains only: {e}")
+        try:
+            response = requests.get(trips_for_route_url(route_id), timeout=10)
+            response.raise_for_status()
+            planner.update_line(line, response.json(), now=depart_at)
+        except Exception as e:
+            print(f"No live trips for the {line} Line, using the timetable only: {e}")
+
+    legs = planner.query(origin, destination, depart_at)
+    if legs is None:
+        print(f"No connection found in the next {HORIZON // 3600} hours")
+        sys.exit(1)
+    for leg in legs:
+        print(f"{_clock(leg.departure)} {leg.board} -> {_clock(leg.arrival)} {leg.alight} ({leg.line} Line)")
+    print(f"Arrive {_clock(legs[-1].arrival)}, {round((legs[-1].arrival - depart_at) / 60)} min")
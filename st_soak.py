@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+
+import gc
+import io
+import sys
+import math
+import time
+import argparse
+import tempfile
+import threading
+import tracemalloc
+import requests
+from array import array
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import st_link
+from st_eta_model import EtaModel
+from st_fakeoba import SimConfig, make_server, server_urls
+from st_link import BulkTrainGetter, TrainGetter, line_to_route_id, stops_for_route_url
+from st_ndjson import NdjsonWriter
+from st_topology import load_topology
+
+parser = argparse.ArgumentParser(description="Soak test of the polling pipeline against a simulated OneBusAway server")
+parser.add_argument('-m', '--mode', choices=['single', 'bulk'], default='bulk', help='Poll one line or the whole agency (default: bulk)')
+parser.add_argument('-l', '--line', type=str, default='1', choices=line_to_route_id.keys(), help='Line in single mode (default: 1)')
+parser.add_argument('-d', '--duration', type=float, default=60, help='Seconds to run (default: 60)')
+parser.add_argument('-i', '--interval', type=float, default=0, help='Seconds between polls, 0 polls back to back (default: 0)')
+parser.add_argument('-r', '--report-every', type=float, default=10, help='Seconds between progress lines (default: 10)')
+parser.add_argument('-j', '--json', action='store_true', help='Run the NDJSON writer (output is discarded)')
+parser.add_argument('--api-base', type=str, default=None, help='Use a running server instead of starting one')
+parser.add_argument('--trace-heap', action='store_true',
+                    help='Measure the Python heap with tracemalloc (slows the polls down several times)')
+# passed to the built-in server
+parser.add_argument('--routes', type=int, default=50, help='Synthetic routes besides the Link lines (default: 50)')
+parser.add_argument('--vehicles', type=int, default=8, help='Vehicles per route (default: 8)')
+parser.add_argument('--latency', type=float, default=0, help='Added response latency in ms (default: 0)')
+parser.add_argument('--jitter', type=float, default=0, help='Random extra latency up to this many ms (default: 0)')
+parser.add_argument('--error-rate', type=float, default=0, help='Share of requests failing with HTTP 500 (default: 0)')
+parser.add_argument('--stale-rate', type=float, default=0, help='Share of vehicles with an old lastUpdateTime (default: 0)')
+parser.add_argument('--padding', type=int, default=0, help='Extra bytes added to every payload (default: 0)')
+
+class _Discard(io.TextIOBase):
+    def write(self, s):
+        return len(s)
+
+class LatencyHistogram():
+    """Log-spaced bucket counts from 0.01 ms to 100 s, allocated once so the soak's own
+    bookkeeping does not show up as heap growth; percentiles are accurate to about 12%."""
+
+    PER_DECADE = 20
+    LOW = 0.01  # ms
+
+    def __init__(self) -> None:
+        self.counts = array('q', [0]) * (7 * self.PER_DECADE)
+        self.total = 0
+
+    def add(self, ms: float) -> None:
+        i = int(math.log10(max(ms, self.LOW) / self.LOW) * self.PER_DECADE)
+        self.counts[min(i, len(self.counts) - 1)] += 1
+        self.total += 1
+
+    def percentile(self, p: float) -> float:
+        if not self.total:
+            return 0.0
+        rank = p / 100 * self.total
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                # upper edge of the bucket
+                return self.LOW * 10 ** ((i + 1) / self.PER_DECADE)
+        return self.LOW * 10 ** (len(self.counts) / self.PER_DECADE)
+
+    def __str__(self) -> str:
+        return "/".join(f"{self.percentile(p):.1f}" for p in (50, 90, 99))
+
+def rss_mb():
+    # peak resident set size; kilobytes on Linux, bytes on macOS, None where unavailable
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+def rss_text() -> str:
+    rss = rss_mb()
+    return "" if rss is None else f", peak rss {rss:.0f} MiB"
+
+class HeapProbe():
+    """Heap size between polls: traced bytes with tracemalloc, otherwise the number of
+    objects the garbage collector tracks, which is cheap enough to leave the timings alone."""
+
+    def __init__(self, trace: bool) -> None:
+        self.trace = trace
+        if trace:
+            tracemalloc.start()
+
+    def sample(self) -> int:
+        if self.trace:
+            return tracemalloc.get_traced_memory()[0]
+        return len(gc.get_objects())
+
+    def peak(self) -> int:
+        return tracemalloc.get_traced_memory()[1] if self.trace else 0
+
+    def stop(self) -> None:
+        if self.trace:
+            tracemalloc.stop()
+
+    def format(self, value: int, baseline: int) -> str:
+        if self.trace:
+            return f"{value / 2**20:.1f} MiB ({(value - baseline) / 2**20:+.2f})"
+        return f"{value} objects ({value - baseline:+d})"
+
+class SoakStats():
+    def __init__(self) -> None:
+        self.fetch_ms = LatencyHistogram()
+        self.process_ms = LatencyHistogram()
+        self.polls = 0
+        self.errors = 0
+        self.trains = 0
+        self.bytes = 0
+
+    def summary(self, elapsed: float) -> str:
+        return (f"{self.polls} polls ({self.polls / elapsed:.1f}/s), {self.trains / elapsed:.0f} trains/s, "
+                f"{self.bytes / elapsed / 1024:.0f} KiB/s, {self.errors} errors | "
+                f"fetch p50/p90/p99 {self.fetch_ms} ms | process p50/p90/p99 {self.process_ms} ms")
+
+def make_getter(args, cache_dir: str, output):
+    # no persisted ETA model and a throwaway topology cache, so the soak leaves nothing behind
+    eta_model = EtaModel(path=None)
+    if args.mode == "bulk":
+        return st_link.vehicles_for_agency_url(st_link.agency_id), BulkTrainGetter(
+            eta_model=eta_model, next_stops=3, output=output, topology_cache=cache_dir, quiet=True)
+    route_id = line_to_route_id[args.line]
+    topology = load_topology(route_id, stops_for_route_url(route_id), cache_dir=cache_dir)
+    return st_link.trips_for_route_url(route_id), TrainGetter(
+        args.line, topology=topology, quiet=True, eta_model=eta_model, output=output)
+
+def count_trains(result) -> int:
+    if isinstance(result, dict):
+        return sum(len(trains) for trains in result.values())
+    return len(result)
+
+def run(args) -> None:
+    server = None
+    if args.api_base:
+        st_link.api_base = args.api_base.rstrip("/")
+    else:
+        config = SimConfig(routes=args.routes, vehicles=args.vehicles, latency=args.latency, jitter=args.jitter,
+                           error_rate=args.error_rate, stale_rate=args.stale_rate, padding=args.padding)
+        server = make_server(config)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        st_link.api_base = server_urls(server)[0]
+    print(f"Polling {st_link.api_base} in {args.mode} mode for {args.duration:.0f} s"
+          + (" (tracemalloc on, timings include its overhead)" if args.trace_heap else ""))
+
+    output = NdjsonWriter(_Discard()) if args.json else None
+    session = requests.Session()
+    with tempfile.TemporaryDirectory() as cache_dir:
+        url, getter = make_getter(args, cache_dir, output)
+        # everything the loop keeps is allocated before the heap is measured
+        stats = SoakStats()
+        heap = HeapProbe(args.trace_heap)
+        start = last_report = time.perf_counter()
+        baseline = None
+        try:
+            while time.perf_counter() - start < args.duration:
+                t0 = time.perf_counter()
+                try:
+                    response = session.get(url, timeout=10)
+                    response.raise_for_status()
+                except requests.RequestException:
+                    stats.errors += 1
+                    response = None
+                if response is not None:
+                    t1 = time.perf_counter()
+                    trains = getter.get_trains(json_str=response.text)
+                    if output:
+                        output.flush()
+                    t2 = time.perf_counter()
+                    stats.polls += 1
+                    stats.trains += count_trains(trains)
+                    stats.bytes += len(response.content)
+                    stats.fetch_ms.add((t1 - t0) * 1000)
+                    stats.process_ms.add((t2 - t1) * 1000)
+                    del response, trains
+                    if baseline is None:
+                        # after the first poll, once topologies and caches are warm
+                        baseline = heap.sample()
+                now = time.perf_counter()
+                if baseline is not None and now - last_report >= args.report_every:
+                    last_report = now
+                    print(f"[{now - start:6.0f} s] {stats.summary(now - start)} | "
+                          f"heap {heap.format(heap.sample(), baseline)}{rss_text()}")
+                if args.interval:
+                    time.sleep(max(args.interval - (time.perf_counter() - t0), 0))
+        except KeyboardInterrupt:
+            pass
+        elapsed = time.perf_counter() - start
+        current, peak = heap.sample(), heap.peak()
+        heap.stop()
+    if server:
+        server.shutdown()
+
+    print(stats.summary(elapsed))
+    if baseline is not None:
+        peak_text = f", peak {peak / 2**20:.1f} MiB" if args.trace_heap else ""
+        print(f"Heap at end {heap.format(current, baseline)} since the first poll{peak_text}{rss_text()}")
+
+if __name__ == "__main__":
+    run(parser.parse_args())
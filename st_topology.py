@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import requests
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+# stops-for-route responses rarely change, so they are fetched once and kept on disk
+TOPOLOGY_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "link-light-rail", "stops-for-route")
+TOPOLOGY_MAX_AGE = 7 * 24 * 3600
+
+@dataclass
+class RouteTopology():
+    route_id: str
+    stop_id_to_name: Dict[str, str]
+    # unique station names in the order of the first stop group
+    station_names: List[str]
+    # stop ids in travel order, per stop group (direction) id
+    stop_groups: Dict[str, List[str]] = field(default_factory=dict)
+    # encoded polylines of the route shape
+    polylines: List[str] = field(default_factory=list)
+    # stop id -> (lat, lon)
+    stop_coords: Dict[str, Tuple[float, float]] = field(default_factory=dict)
+
+def _merge_names(station_names: List[str], names: List[str]) -> None:
+    """Add the stops of another direction, each after the last known stop before it."""
+    shared = [station_names.index(n) for n in names if n in station_names]
+    if station_names and not (len(shared) > 1 and shared[0] < shared[-1]):
+        names = names[::-1]  # the other direction, walk it in line order
+    cursor = -1
+    for name in names:
+        if name in station_names:
+            cursor = station_names.index(name)
+        else:
+            cursor += 1
+            station_names.insert(cursor, name)
+
+def parse_topology(route_id, api_dict) -> RouteTopology:
+    data = api_dict["data"]
+    stop_id_to_name = {stop["id"]: stop["name"] for stop in data["references"]["stops"]}
+    entry = data.get("entry", {})
+    stop_groups = {}
+    for grouping in entry.get("stopGroupings", []):
+        for group in grouping.get("stopGroups", []):
+            stop_groups.setdefault(group.get("id", str(len(stop_groups))), group.get("stopIds", []))
+    station_names = []
+    for stop_ids in list(stop_groups.values()) or [entry.get("stopIds", [])]:
+        names = [stop_id_to_name[i] for i in stop_ids if stop_id_to_name.get(i)]
+        _merge_names(station_names, names)
+    polylines = [p["points"] for p in entry.get("polylines", []) if p.get("points")]
+    stop_coords = {stop["id"]: (stop["lat"], stop["lon"]) for stop in data["references"]["stops"]
+                   if "lat" in stop and "lon" in stop}
+    return RouteTopology(route_id, stop_id_to_name, station_names, stop_groups, polylines, stop_coords)
+
+def load_topology(route_id, url, cache_dir=TOPOLOGY_CACHE_DIR, max_age=TOPOLOGY_MAX_AGE) -> RouteTopology:
+    """Return the topology of a route, from the cache when it is fresh enough."""
+    path = os.path.join(cache_dir, f"{route_id}.json")
+    try:
+        if time.time() - os.path.getmtime(path) <= max_age:
+            with open(path) as f:
+                return parse_topology(route_id, json.load(f))
+    except (OSError, ValueError, KeyError):
+        pass  # missing or unreadable cache, refetch below
+
+    response = requests.get(url, timeout=10)
+    response.raise_for_status()
+    api_dict = response.json()
+    topology = parse_topology(route_id, api_dict)
+    os.makedirs(cache_dir, exist_ok=True)
+    # write then rename so a concurrent reader never sees half a file
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(api_dict, f)
+    os.replace(tmp, path)
+    return topology
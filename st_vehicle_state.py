@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Tuple
+
+# defaults tuned for 30 s polling: 32 samples is ~15 minutes of history
+DEFAULT_CAPACITY = 32
+DEFAULT_DWELL_EPSILON = 5.0      # metres; less movement than this counts as stopped
+DEFAULT_EXPIRE_AFTER = 15 * 60   # seconds without a sample before a vehicle is forgotten
+DEFAULT_MAX_VEHICLES = 512
+DEFAULT_PASSAGE_MAX_GAP = 600    # seconds per stop; longer legs (held train, feed outage) are not learned from
+
+@dataclass
+class VehicleEvent():
+    kind: str            # "dwell_start", "dwell_end", "stop_passed" or "trip_change"
+    vehicle_id: str
+    trip_id: str
+    stop_index: int
+    time: float
+    duration: float = 0.0
+    # for "stop_passed": the stop passed before this one, -1 if unknown
+    previous_stop: int = -1
+
+class VehicleHistory():
+    """Fixed-size ring buffer of (time, stop index, distance) samples for one vehicle."""
+
+    __slots__ = ("capacity", "times", "stops", "distances", "head", "count",
+                 "trip_id", "dwell_start", "last_seen", "passed_stop", "passed_time")
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY) -> None:
+        self.capacity = capacity
+        # preallocated once; appends only overwrite slots
+        self.times = array('d', [0.0]) * capacity
+        self.stops = array('i', [-1]) * capacity
+        self.distances = array('d', [0.0]) * capacity
+        self.head = 0       # slot the next sample is written to
+        self.count = 0
+        self.trip_id: Optional[str] = None
+        self.dwell_start: Optional[float] = None
+        self.last_seen = 0.0
+        # last stop the vehicle was seen to pass on this trip
+        self.passed_stop = -1
+        self.passed_time = 0.0
+
+    def append(self, t: float, stop_index: int, distance: float) -> None:
+        i = self.head
+        self.times[i] = t
+        self.stops[i] = stop_index
+        self.distances[i] = distance
+        self.head = (i + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def clear(self) -> None:
+        self.head = 0
+        self.count = 0
+        self.dwell_start = None
+        self.passed_stop = -1
+        self.passed_time = 0.0
+
+    def latest(self) -> Optional[Tuple[float, int, float]]:
+        if not self.count:
+            return None
+        i = (self.head - 1) % self.capacity
+        return self.times[i], self.stops[i], self.distances[i]
+
+    def samples(self) -> Iterator[Tuple[float, int, float]]:
+        # oldest to newest
+        start = (self.head - self.count) % self.capacity
+        for k in range(self.count):
+            i = (start + k) % self.capacity
+            yield self.times[i], self.stops[i], self.distances[i]
+
+    def __len__(self) -> int:
+        return self.count
+
+class VehicleStateStore():
+    """Per-vehicle history kept across polls.
+
+    Memory is bounded by ``capacity`` samples per vehicle and ``max_vehicles``
+    vehicles; vehicles not seen for ``expire_after`` seconds are dropped.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY,
+                 dwell_epsilon: float = DEFAULT_DWELL_EPSILON,
+                 expire_after: float = DEFAULT_EXPIRE_AFTER,
+                 max_vehicles: int = DEFAULT_MAX_VEHICLES,
+                 passage_max_gap: float = DEFAULT_PASSAGE_MAX_GAP) -> None:
+        self.capacity = capacity
+        self.dwell_epsilon = dwell_epsilon
+        self.expire_after = expire_after
+        self.max_vehicles = max_vehicles
+        self.passage_max_gap = passage_max_gap
+        # least recently seen first, so expiry only looks at the front
+        self._vehicles: "OrderedDict[str, VehicleHistory]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._vehicles)
+
+    def __contains__(self, vehicle_id: str) -> bool:
+        return vehicle_id in self._vehicles
+
+    def get(self, vehicle_id: str) -> Optional[VehicleHistory]:
+        return self._vehicles.get(vehicle_id)
+
+    def update(self, vehicle_id: str, trip_id: str, t: float,
+               stop_index: int, distance: float) -> List[VehicleEvent]:
+        """Record one sample and return the events it triggered."""
+        events = []
+        hist = self._vehicles.get(vehicle_id)
+        if hist is None:
+            hist = VehicleHistory(self.capacity)
+            self._vehicles[vehicle_id] = hist
+        else:
+            self._vehicles.move_to_end(vehicle_id)
+        hist.last_seen = max(hist.last_seen, t)
+
+        if hist.trip_id is not None and hist.trip_id != trip_id:
+            events.append(VehicleEvent("trip_change", vehicle_id, trip_id, stop_index, t))
+            # distances are per trip, so old samples are not comparable any more
+            hist.clear()
+        hist.trip_id = trip_id
+
+        prev = hist.latest()
+        if prev is not None:
+            prev_t, prev_stop, prev_distance = prev
+            if t <= prev_t:
+                # upstream has not refreshed this vehicle since the last poll
+                return events
+            stationary = (stop_index == prev_stop
+                          and abs(distance - prev_distance) <= self.dwell_epsilon)
+            if stationary and hist.dwell_start is None:
+                hist.dwell_start = prev_t
+                events.append(VehicleEvent("dwell_start", vehicle_id, trip_id, stop_index, prev_t))
+            elif not stationary and hist.dwell_start is not None:
+                events.append(VehicleEvent("dwell_end", vehicle_id, trip_id, prev_stop, t,
+                                           duration=t - hist.dwell_start))
+                hist.dwell_start = None
+            if stop_index != prev_stop and prev_stop >= 0:
+                # every stop from prev_stop up to the one before stop_index was passed between
+                # the two samples; spread the passages evenly over the gap
+                if stop_index >= 0:
+                    step = 1 if stop_index > prev_stop else -1
+                    passed = list(range(prev_stop, stop_index, step))
+                else:
+                    passed = [prev_stop]
+                share = (t - prev_t) / len(passed)
+                for k, stop in enumerate(passed):
+                    passed_time = prev_t + (k + 0.5) * share
+                    duration = 0.0
+                    if hist.passed_stop >= 0 and passed_time - hist.passed_time <= self.passage_max_gap:
+                        duration = passed_time - hist.passed_time
+                    events.append(VehicleEvent("stop_passed", vehicle_id, trip_id, stop, passed_time,
+                                               duration=duration, previous_stop=hist.passed_stop))
+                    hist.passed_stop = stop
+                    hist.passed_time = passed_time
+        hist.append(t, stop_index, distance)
+
+        self.expire(t)
+        return events
+
+    def dwell_time(self, vehicle_id: str, now: float) -> float:
+        hist = self._vehicles.get(vehicle_id)
+        if hist is None or hist.dwell_start is None:
+            return 0.0
+        return max(now - hist.dwell_start, 0.0)
+
+    def last_passage(self, vehicle_id: str) -> Tuple[int, float]:
+        hist = self._vehicles.get(vehicle_id)
+        if hist is None:
+            return -1, 0.0
+        return hist.passed_stop, hist.passed_time
+
+    def expire(self, now: float) -> None:
+        vehicles = self._vehicles
+        while vehicles:
+            vehicle_id, hist = next(iter(vehicles.items()))
+            if len(vehicles) <= self.max_vehicles and now - hist.last_seen <= self.expire_after:
+                break
+            del vehicles[vehicle_id]